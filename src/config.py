@@ -1,7 +1,22 @@
-PNM_BYTES_PER_PIXEL = {'P5': 1, 'P6': 3}
-PNM_SUPPORTED_FORMATS = tuple(PNM_BYTES_PER_PIXEL.keys())
-P5 = PNM_SUPPORTED_FORMATS[0]
-P6 = PNM_SUPPORTED_FORMATS[1]
+PNM_BYTES_PER_PIXEL = {'P1': 1, 'P2': 1, 'P3': 3, 'P4': 1, 'P5': 1, 'P6': 3}
+PNM_SUPPORTED_FORMATS = tuple(PNM_BYTES_PER_PIXEL.keys()) + ('P7',)
+PNM_PLAIN_FORMATS = ('P1', 'P2', 'P3')
+PNM_BITMAP_FORMATS = ('P1', 'P4')
+PNM_RAW_FORMATS = ('P5', 'P6', 'P7')
+PNM_WRITABLE_FORMATS = PNM_RAW_FORMATS
+PNM_RAW_FORMAT_OF = {
+    'P1': 'P5', 'P2': 'P5', 'P3': 'P6', 'P4': 'P5', 'P5': 'P5', 'P6': 'P6', 'P7': 'P7'
+}
+P5 = 'P5'
+P6 = 'P6'
+P7 = 'P7'
+PAM_TUPLE_TYPES = {'GRAYSCALE': 1, 'GRAYSCALE_ALPHA': 2, 'RGB': 3, 'RGB_ALPHA': 4}
+PNM_MAX_COLOR_8_BIT = 255
+PNM_MAX_COLOR = 65535
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+PNG_BIT_DEPTHS = {0: (1, 2, 4, 8, 16), 2: (8, 16), 3: (1, 2, 4, 8), 4: (8, 16), 6: (8, 16)}
+# chroma of the float luma-chroma models sits around this value
+CHROMA_CENTER = 0.5
 COLOR_MODELS = {'RGB': 1, 'HSL': 2, 'HSV': 3, 'YCbCr601': 4, 'YCbCr709': 5, 'YCoCg': 6, 'CMY': 7}
 DITHERING_ALGORITHMS = {
     'NONE': 1, 'RANDOM': 2, 'ORDERED_8X8': 3, 'FLOYD_STEINBERG': 4, 'ATKINSON': 5
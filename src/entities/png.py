@@ -1,16 +1,22 @@
 import dataclasses
 import enum
+import struct
 import typing
-import zlib
+from array import array
 
 from PyQt6 import QtGui
 
+from src import config
 from src.errors.png import (
     PngBitDepthError, PngColorTypeError, PngError, PngChunkTypeError,
     PngChunkError
 )
-from src.utils.gamma import resolve_gamma, GammaOption
-from src.utils.png import get_chunk_length
+from src.utils.gamma import GammaOption, apply_gamma_lut, gamma_lut
+from src.utils.png import (
+    ADAM7_BLOCKS, ADAM7_PASSES, adam7_pass_sizes, expand_palette, get_chunk_length,
+    iter_pass_scanlines, iter_scanlines, pack_samples, scatter_pass_row, to_8bit_samples,
+    transparency_mask, unpack_samples,
+)
 
 
 class ChunkType(enum.Enum):
@@ -40,6 +46,15 @@ class ChunkType(enum.Enum):
     orNT = 23
 
 
+@dataclasses.dataclass(frozen=True)
+class ChunkLocation:
+    """ Where the body of a chunk is in the file, without the body itself. """
+
+    ctype: str
+    offset: int
+    length: int
+
+
 class Chunk:
     LENGTH_BYTES_COUNT, TYPE_BYTES_COUNT, CRC_BYTES_COUNT = 4, 4, 4
 
@@ -47,8 +62,8 @@ class Chunk:
         self,
         length: int,
         ctype: str,
-        data: typing.List[int],
-        crc: str,
+        data: bytes,
+        crc: int,
     ):
         self.length = length
         self.ctype = ChunkType[ctype]
@@ -71,8 +86,8 @@ class IHDRChunk(Chunk):
         self,
         length: int,
         ctype: str,
-        data: typing.List[int],
-        crc: str,
+        data: bytes,
+        crc: int,
     ):
         super().__init__(length, ctype, data, crc)
 
@@ -97,9 +112,12 @@ class IHDRChunk(Chunk):
         left, right = right, right + self.INTERLACE_METHOD_BYTES_COUNT
         self.interlace_method = get_chunk_length(data[left:right])
 
-        # todo: support other color types
-        self.bpx = 3 if self.color_type == 2 else 1
-        # self.__validate()
+        self.__validate()
+        self.channels = config.PNG_CHANNELS[self.color_type]
+        bits_per_px = self.channels * self.bit_depth
+        # filters work on whole bytes, sub-byte pixels are compared to the previous byte
+        self.bpx = max(1, bits_per_px // 8)
+        self.row_size = (self.width * bits_per_px + 7) // 8
 
     def __repr__(self) -> str:
         return (
@@ -119,23 +137,20 @@ class IHDRChunk(Chunk):
         if self.ctype != ChunkType.IHDR:
             raise PngChunkTypeError('Invalid chunk type, expected IHDR')
 
-        if self.bit_depth not in [1, 2, 4, 8, 16]:
-            raise PngBitDepthError('Invalid IHDR chunk bit depth')
-
-        if self.color_type not in [0, 2, 3, 4, 6]:
+        if self.color_type not in config.PNG_BIT_DEPTHS:
             raise PngColorTypeError('Invalid IHDR chunk color type')
 
-        if self.bit_depth != 8:
-            raise PngBitDepthError('Only 8-bit depth is supported')
+        if self.bit_depth not in config.PNG_BIT_DEPTHS[self.color_type]:
+            raise PngBitDepthError('Invalid IHDR chunk bit depth')
 
-        if self.color_type in [4, 6]:
-            raise PngColorTypeError('Alpha channel is not supported')
+        if self.compression_method != 0:
+            raise PngError('Unknown compression method')
 
-        if self.interlace_method != 0:
-            raise PngError('Interlacing is not supported')
+        if self.interlace_method not in (0, 1):
+            raise PngError('Unknown interlace method')
 
         if self.filter_method != 0:
-            raise PngError('Filtering is not supported')
+            raise PngError('Unknown filter method')
 
 
 class GammaChunk(Chunk):
@@ -144,8 +159,8 @@ class GammaChunk(Chunk):
         self,
         length: int,
         ctype: str,
-        data: typing.List[int],
-        crc: str,
+        data: bytes,
+        crc: int,
     ):
         super().__init__(length, ctype, data, crc)
 
@@ -182,6 +197,7 @@ class PngFileUI:
         self.iend_chunk = iend_chunk
         self.ancillary_chunks = ancillary_chunks
         self.gamma_chunk = None
+        self.palette_chunk, self.transparency_chunk = None, None
         for c in self.ancillary_chunks:
             if c.ctype == ChunkType.gAMA:
                 self.gamma_chunk = GammaChunk(
@@ -190,7 +206,13 @@ class PngFileUI:
                     c.data,
                     c.crc,
                 )
-                break
+            elif c.ctype == ChunkType.PLTE:
+                self.palette_chunk = c
+            elif c.ctype == ChunkType.tRNS:
+                self.transparency_chunk = c
+
+        if self.ihdr_chunk.color_type == 3 and self.palette_chunk is None:
+            raise PngChunkError('PLTE chunk is required for indexed color')
 
     def __repr__(self) -> str:
         return (
@@ -200,111 +222,207 @@ class PngFileUI:
             f"\n\tancillary_chunks={len(self.ancillary_chunks)}\n)"
         )
 
-    def to_qpixmap(self) -> QtGui.QPixmap:
-        painter = QtGui.QPainter()
-        pixmap = QtGui.QPixmap(self.ihdr_chunk.width, self.ihdr_chunk.height)
-
-        decompressed_data = zlib.decompress(b''.join([
-            bytes(chunk.data) for chunk in self.idat_chunks
-        ]))
-
-        scanline_length = self.ihdr_chunk.width * self.ihdr_chunk.bpx
-        scanlines = [
-            (decompressed_data[i], decompressed_data[i + 1:i + scanline_length + 1])
-            for i in range(0, len(decompressed_data), scanline_length + 1)
-        ]
-
-        reconstructed_pxs = []
-        painter.begin(pixmap)
-        for i, (filter_type, scanline) in enumerate(scanlines):
-            # print(filter_type, scanline)
-            for j in range(0, scanline_length, self.ihdr_chunk.bpx):
-                for k in range(self.ihdr_chunk.bpx):
-                    add_val = apply_filter(
-                        filter_type=filter_type,
-                        reconstructed_filters=reconstructed_pxs,
-                        bpx=self.ihdr_chunk.bpx,
-                        row=i,
-                        col=j + k,
-                        scanline_length=scanline_length,
-                    )
-                    px = (scanline[j + k] + add_val) % 256
-                    reconstructed_pxs.append(px)
-
-                rgb = reconstructed_pxs[-self.ihdr_chunk.bpx:]
-                if self.ihdr_chunk.bpx == 1:
-                    rgb = [rgb[0], rgb[0], rgb[0]]
-
-                next_gamma = 0
-                if self.gamma_chunk:
-                    next_gamma = self.gamma_chunk.get_gamma()
-
-                rgb = resolve_gamma(
-                    px=[x / 255.0 for x in rgb],
-                    prev_gamma=2.2,
-                    next_gamma=next_gamma,
-                    gamma_option=GammaOption.ASSIGN,
-                )
-                painter.setPen(QtGui.QColor(*[int(x * 255) for x in rgb]))
-                painter.drawPoint(j // self.ihdr_chunk.bpx, i)
-
-        painter.end()
-        return pixmap
+    def iter_rows(self) -> typing.Iterator[bytearray]:
+        """ Yields unfiltered scanlines while IDAT chunks are decompressed one by one.
 
+        Interlaced images are decoded as a whole first.
+        """
 
-def apply_filter(
-    filter_type: int,
-    reconstructed_filters: typing.List[int],
-    row: int,
-    col: int,
-    scanline_length: int,
-    bpx: int,
-):
-    if filter_type == 0:
-        return 0
+        if self.ihdr_chunk.interlace_method == 1:
+            pixels, row_size = self.decode(), self.ihdr_chunk.row_size
+            return (pixels[i:i + row_size] for i in range(0, len(pixels), row_size))
 
-    def left():
-        return (
-            reconstructed_filters[row * scanline_length + col - bpx]
-            if col >= bpx else 0
+        return iter_scanlines(
+            chunks=(bytes(chunk.data) for chunk in self.idat_chunks),
+            row_size=self.ihdr_chunk.row_size,
+            height=self.ihdr_chunk.height,
+            bpp=self.ihdr_chunk.bpx,
         )
 
-    def up():
-        return (
-            reconstructed_filters[(row - 1) * scanline_length + col]
-            if row > 0 else 0
-        )
+    def decode(self) -> bytearray:
+        """ Decompresses and unfilters IDAT data into a contiguous pixel buffer. """
 
-    def up_left():
-        return (
-            reconstructed_filters[(row - 1) * scanline_length + col - bpx]
-            if row > 0 and col >= bpx else 0
+        ihdr = self.ihdr_chunk
+        if ihdr.interlace_method == 1:
+            return pack_samples(self.decode_samples(), ihdr.bit_depth, ihdr.width * ihdr.channels)
+
+        row_size = self.ihdr_chunk.row_size
+        pixels = bytearray(row_size * self.ihdr_chunk.height)
+        for y, row in enumerate(self.iter_rows()):
+            pixels[y * row_size:(y + 1) * row_size] = row
+
+        return pixels
+
+    def decode_samples(
+        self,
+        on_pass: typing.Optional[typing.Callable[[typing.Union[bytearray, array]], None]] = None,
+    ) -> typing.Union[bytearray, array]:
+        """ Unpacked samples of all the pixels, see `unpack_samples`.
+
+        Adam7 passes are scattered into the image as soon as their rows are
+        decoded. If `on_pass` is given, it is called after every pass with the
+        samples where each known pixel is repeated over the area of the pixels
+        to come, so the whole image is covered from the first pass on.
+        """
+
+        ihdr = self.ihdr_chunk
+        samples_per_row = ihdr.width * ihdr.channels
+        if ihdr.interlace_method == 0:
+            return unpack_samples(self.decode(), ihdr.bit_depth, samples_per_row, ihdr.row_size)
+
+        size = samples_per_row * ihdr.height
+        samples = array('H', bytes(size * 2)) if ihdr.bit_depth == 16 else bytearray(size)
+        bits_per_px = ihdr.channels * ihdr.bit_depth
+        pass_sizes = adam7_pass_sizes(ihdr.width, ihdr.height)
+        rows = iter_pass_scanlines(
+            chunks=(bytes(chunk.data) for chunk in self.idat_chunks),
+            images=[((width * bits_per_px + 7) // 8, height) for width, height in pass_sizes],
+            bpp=ihdr.bpx,
         )
 
-    def avg():
-        return (left() + up()) // 2
+        current, y = None, 0
+        for pass_index, row in rows:
+            if pass_index != current:
+                if current is not None and on_pass is not None:
+                    on_pass(samples)
+
+                current, y = pass_index, 0
+
+            pass_width = pass_sizes[pass_index][0]
+            _, y0, _, dy = ADAM7_PASSES[pass_index]
+            scatter_pass_row(
+                samples=samples,
+                row=unpack_samples(row, ihdr.bit_depth, pass_width * ihdr.channels, len(row)),
+                y=y0 + y * dy,
+                width=ihdr.width,
+                height=ihdr.height,
+                channels=ihdr.channels,
+                pass_index=pass_index,
+                block=(1, 1) if on_pass is None else ADAM7_BLOCKS[pass_index],
+            )
+            y += 1
 
-    def paeth():
-        a, b, c = left(), up(), up_left()
-        p = a + b - c
-        pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
-        if pa <= pb and pa <= pc:
-            return a
-        elif pb <= pc:
-            return b
+        if on_pass is not None:
+            on_pass(samples)
 
-        return c
+        return samples
 
-    if filter_type == 1:
-        return left()
+    def has_alpha(self) -> bool:
+        return self.ihdr_chunk.color_type in (4, 6) or self.transparency_chunk is not None
 
-    if filter_type == 2:
-        return up()
+    def to_rgb888(self) -> bytearray:
+        """ Decodes the image into packed RGB888 with the display gamma applied. """
 
-    if filter_type == 3:
-        return avg()
+        return self.__to_rgb888(self.decode_samples())
 
-    if filter_type == 4:
-        return paeth()
+    def to_rgba8888(self) -> bytearray:
+        """ Same as `to_rgb888` with the alpha channel, gamma is not applied to alpha. """
 
-    raise PngError(f'Invalid filter type: {filter_type}')
+        return self.__to_rgba8888(self.decode_samples())
+
+    def __to_rgb888(
+        self,
+        samples: typing.Union[bytearray, array],
+    ) -> bytearray:
+        rgb, _ = self.__expand(samples)
+        return apply_gamma_lut(rgb, self.__gamma_table())
+
+    def __to_rgba8888(
+        self,
+        samples: typing.Union[bytearray, array],
+    ) -> bytearray:
+        rgb, alpha = self.__expand(samples)
+        rgb = apply_gamma_lut(rgb, self.__gamma_table())
+        rgba = bytearray(len(rgb) // 3 * 4)
+        for channel in range(3):
+            rgba[channel::4] = rgb[channel::3]
+
+        rgba[3::4] = alpha if alpha is not None else b'\xff' * (len(rgb) // 3)
+        return rgba
+
+    def __gamma_table(self) -> bytes:
+        next_gamma = 0
+        if self.gamma_chunk:
+            next_gamma = self.gamma_chunk.get_gamma()
+
+        return gamma_lut(2.2, next_gamma, GammaOption.ASSIGN)
+
+    def __expand(
+        self,
+        samples: typing.Union[bytearray, array],
+    ) -> typing.Tuple[bytearray, typing.Optional[bytearray]]:
+        """ 8-bit RGB samples and alpha, if the image has it, of every pixel. """
+
+        ihdr = self.ihdr_chunk
+        transparency = None
+        if self.transparency_chunk is not None:
+            transparency = bytes(self.transparency_chunk.data)
+
+        if ihdr.color_type == 3:
+            return expand_palette(samples, bytes(self.palette_chunk.data), transparency)
+
+        channels = ihdr.channels
+        alpha = None
+        if ihdr.color_type in (4, 6):
+            alpha = to_8bit_samples(samples[channels - 1::channels], ihdr.bit_depth)
+        elif transparency is not None and ihdr.color_type == 0:
+            alpha = transparency_mask(samples, int.from_bytes(transparency[:2], 'big'))
+        elif transparency is not None:
+            key = struct.unpack('>HHH', transparency[:6])
+            alpha = transparency_mask(zip(samples[0::3], samples[1::3], samples[2::3]), key)
+
+        if ihdr.color_type in (0, 4):
+            gray = to_8bit_samples(samples[0::channels], ihdr.bit_depth)
+            rgb = bytearray(len(gray) * 3)
+            rgb[0::3] = rgb[1::3] = rgb[2::3] = gray
+            return rgb, alpha
+
+        samples = to_8bit_samples(samples, ihdr.bit_depth)
+        if ihdr.color_type == 2:
+            return samples, alpha
+
+        rgb = bytearray(len(samples) // 4 * 3)
+        for channel in range(3):
+            rgb[channel::3] = samples[channel::4]
+
+        return rgb, alpha
+
+    def to_qimage(
+        self,
+        on_pass: typing.Optional[typing.Callable[[QtGui.QImage], None]] = None,
+    ) -> QtGui.QImage:
+        """ Wraps the RGB888 or RGBA8888 buffer into a QImage, pixels are copied once into Qt.
+
+        `on_pass` gets coarse previews of interlaced images, see `decode_samples`.
+        """
+
+        if on_pass is None:
+            return self.__to_qimage(self.decode_samples())
+
+        return self.__to_qimage(
+            self.decode_samples(lambda samples: on_pass(self.__to_qimage(samples)))
+        )
+
+    def __to_qimage(
+        self,
+        samples: typing.Union[bytearray, array],
+    ) -> QtGui.QImage:
+        width, height = self.ihdr_chunk.width, self.ihdr_chunk.height
+        if self.has_alpha():
+            pixels, image_format = self.__to_rgba8888(samples), QtGui.QImage.Format.Format_RGBA8888
+        else:
+            pixels, image_format = self.__to_rgb888(samples), QtGui.QImage.Format.Format_RGB888
+
+        bytes_per_line = len(pixels) // height
+        return QtGui.QImage(pixels, width, height, bytes_per_line, image_format).copy()
+
+    def to_qpixmap(
+        self,
+        on_pass: typing.Optional[typing.Callable[[QtGui.QPixmap], None]] = None,
+    ) -> QtGui.QPixmap:
+        if on_pass is None:
+            return QtGui.QPixmap.fromImage(self.to_qimage())
+
+        return QtGui.QPixmap.fromImage(
+            self.to_qimage(lambda image: on_pass(QtGui.QPixmap.fromImage(image)))
+        )
@@ -1,5 +1,9 @@
 import dataclasses
+import itertools
 import typing
+from array import array
+
+from src import config
 
 
 @dataclasses.dataclass
@@ -14,7 +18,8 @@ class PnmFile:
         height: int,
         max_color: int,
         bytes_per_pixel: int,
-        content: bytes,
+        content: typing.Union[bytes, memoryview, array],
+        tuple_type: typing.Optional[str] = None,
     ):
         self.pnm_format = pnm_format
         self.width = width
@@ -22,6 +27,7 @@ class PnmFile:
         self.max_color = max_color
         self.bytes_per_pixel = bytes_per_pixel
         self.content = content
+        self.tuple_type = tuple_type
         return self
 
     pnm_format: str
@@ -29,30 +35,86 @@ class PnmFile:
     height: int
     max_color: int
     bytes_per_pixel: int
-    content: bytes
+    content: typing.Union[bytes, memoryview, array]
+    tuple_type: typing.Optional[str] = None
 
     def get_size(self):
         return self.width * self.height * self.bytes_per_pixel
 
+    def get_sample_size(self):
+        return 1 if self.max_color <= config.PNM_MAX_COLOR_8_BIT else 2
+
+    def get_row_size(self):
+        if self.pnm_format in config.PNM_BITMAP_FORMATS:
+            return (self.width + 7) // 8
+
+        return self.width * self.bytes_per_pixel * self.get_sample_size()
+
+    def get_body_size(self):
+        return self.get_row_size() * self.height
+
 
-@dataclasses.dataclass
 class PnmFileUI:
-    pnm_format: str
-    width: int
-    height: int
-    max_color: int
-    bytes_per_px: int
-    content: typing.List[float]
+    """ Normalized image for the UI, samples are kept in a contiguous float32 array.
+
+    Pixel accessors return memoryviews over the array where possible, so the
+    per-pixel loops do not allocate a new list for every pixel.
+    """
+
+    __slots__ = (
+        'pnm_format', 'width', 'height', 'max_color', 'bytes_per_px', 'tuple_type',
+        '_content', '_view',
+    )
+
+    def __init__(
+        self,
+        pnm_format: str,
+        width: int,
+        height: int,
+        max_color: int,
+        bytes_per_px: int,
+        content: typing.Union[array, typing.Iterable[float]],
+        tuple_type: typing.Optional[str] = None,
+    ):
+        self.pnm_format = pnm_format
+        self.width = width
+        self.height = height
+        self.max_color = max_color
+        self.bytes_per_px = bytes_per_px
+        self.tuple_type = tuple_type
+        self.content = content
+
+    @property
+    def content(self) -> array:
+        return self._content
+
+    @content.setter
+    def content(self, content: typing.Union[array, typing.Iterable[float]]):
+        if not isinstance(content, array) or content.typecode != 'f':
+            content = array('f', content)
+
+        self._content = content
+        self._view = memoryview(content)
 
     def get_size(self):
         return self.width * self.height * self.bytes_per_px
 
-    def get_px(self, x, disabled_channels: list[bool] = None) -> typing.List[float]:
-        first_px = x
-        colors = self.content[first_px: first_px + self.bytes_per_px]
+    def get_color_channels(self):
+        # alpha goes last in PAM tuples, it is kept as is by the color processing
+        return 3 if self.bytes_per_px >= 3 else 1
+
+    def get_row(self, y) -> memoryview:
+        row_size = self.width * self.bytes_per_px
+        return self._view[y * row_size: (y + 1) * row_size]
 
-        if len(colors) == 1:
-            colors = [colors[0], colors[0], colors[0]]
+    def get_px(self, x, disabled_channels: list[bool] = None) -> typing.Sequence[float]:
+        if self.get_color_channels() == 1:
+            gray = self._content[x]
+            colors = [gray, gray, gray]
+        elif not disabled_channels or not any(disabled_channels):
+            return self._view[x: x + 3]
+        else:
+            colors = self._view[x: x + 3].tolist()
 
         if not disabled_channels:
             return colors
@@ -64,8 +126,34 @@ class PnmFileUI:
         return colors
 
     def set_px(self, x, val):
-        for i in range(self.bytes_per_px):
-            self.content[x + i] = val[i]
+        if isinstance(val, memoryview):
+            self._view[x: x + len(val)] = val
+            return
+
+        for i in range(self.get_color_channels()):
+            self._content[x + i] = val[i]
+
+    def get_rgb_channels(self, disabled_channels: list[bool] = None) -> typing.List[array]:
+        """ Whole image as three channels, like `get_px` gives them for every pixel. """
+
+        size = self.width * self.height
+        if self.get_color_channels() == 1:
+            gray = self._content[0::self.bytes_per_px]
+            channels = [gray, gray, gray]
+        else:
+            channels = [self._content[i::self.bytes_per_px] for i in range(3)]
+
+        return [
+            array('f', bytes(size * channels[i].itemsize))
+            if disabled_channels and disabled_channels[i] else channels[i]
+            for i in range(3)
+        ]
+
+    def set_color_channels(self, channels: typing.Sequence[typing.Iterable[float]]):
+        """ Writes the color channels back, a gray image takes only the first one. """
+
+        for i in range(self.get_color_channels()):
+            self._content[i::self.bytes_per_px] = array('f', channels[i])
 
     def get_px_255(self, x, disabled_channels) -> typing.List[int]:
         return [
@@ -73,6 +161,23 @@ class PnmFileUI:
             for color in self.get_px(x, disabled_channels)
         ]
 
+    def get_channel_255(self, channel) -> bytes:
+        """ Quantizes one channel of the whole image, every step runs inside `map`. """
+
+        values = map(int, map((255.0).__mul__, self._content[channel::self.bytes_per_px]))
+        return bytes(map(max, itertools.repeat(0), map(min, itertools.repeat(255), values)))
+
+    def to_rgb888(self) -> bytearray:
+        rgb = bytearray(self.width * self.height * 3)
+        if self.get_color_channels() == 1:
+            rgb[0::3] = rgb[1::3] = rgb[2::3] = self.get_channel_255(0)
+            return rgb
+
+        for channel in range(3):
+            rgb[channel::3] = self.get_channel_255(channel)
+
+        return rgb
+
     def get_x(self, i):
         real_pos = i // self.bytes_per_px
         return real_pos % self.width
@@ -0,0 +1,12 @@
+import dataclasses
+import typing
+
+
+@dataclasses.dataclass
+class ImageInfo:
+    image_format: str
+    width: int
+    height: int
+    bit_depth: int
+    channels: int
+    gamma: typing.Optional[float] = None
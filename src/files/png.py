@@ -1,16 +1,27 @@
+import itertools
+import mmap
 import struct
 import typing
 import zlib
 
-from src.entities.png import Chunk, ChunkType, IHDRChunk, PngFileUI, GammaChunk
+from src import config
+from src.entities.png import (
+    Chunk, ChunkLocation, ChunkType, IHDRChunk, PngFileUI, GammaChunk,
+)
+from src.entities.probe import ImageInfo
 from src.errors.png import (
-    PngError,
+    PngChunkTypeError, PngError,
+)
+from src.utils.png import (
+    iter_scanlines, iter_filtered_scanlines, FILTER_ADAPTIVE, FILTER_TYPES,
+    CompressionProfile, COMPRESSION_PROFILES, COMPRESSION_STRATEGIES, IDAT_CHUNK_SIZE,
+    MAX_CHUNK_SIZE, deflate, gather_passes, pack_samples, parallel_deflate, unpack_samples,
 )
-from src.utils.png import get_chunk_length
 
 
 class PngIO:
     HEADER_BYTES_COUNT = 8
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
 
     def __init__(
         self,
@@ -19,56 +30,150 @@ class PngIO:
     ):
         self.__image_path = image_path
         self.mode = mode
+        self.__mapped = None
+        self.__index = None
 
     def __enter__(self):
         self.__file = open(self.__image_path, self.mode)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.__mapped is not None:
+            self.__mapped.close()
+
+        self.__mapped, self.__index = None, None
         self.__file.close()
         self.__file = None
 
+    def index_chunks(self) -> typing.List[ChunkLocation]:
+        """ Locates every chunk up to IEND, only the 8 bytes in front of a body are read.
+
+        The file is memory mapped, so skipping a body is just moving an offset.
+        """
+
+        if self.__index is not None:
+            return self.__index
+
+        mapped = self.__map()
+        if mapped[:self.HEADER_BYTES_COUNT] != self.SIGNATURE:
+            raise PngError('Invalid PNG signature')
+
+        head_size = Chunk.LENGTH_BYTES_COUNT + Chunk.TYPE_BYTES_COUNT
+        index, offset = [], self.HEADER_BYTES_COUNT
+        while True:
+            if offset + head_size > len(mapped):
+                raise PngError('Unexpected end of file')
+
+            length, ctype = struct.unpack_from('>I4s', mapped, offset)
+            body_offset = offset + head_size
+            offset = body_offset + length + Chunk.CRC_BYTES_COUNT
+            if offset > len(mapped):
+                raise PngError('Unexpected end of file')
+
+            index.append(ChunkLocation(ctype.decode('latin-1'), body_offset, length))
+            if ctype == b'IEND':
+                break
+
+        self.__index = index
+        return index
+
+    def probe(self) -> ImageInfo:
+        """ Reads IHDR and gAMA only, bodies of all other chunks are never touched. """
+
+        ihdr_chunk, gamma_chunk = None, None
+        for location in self.index_chunks():
+            if location.ctype == ChunkType.IHDR.name and ihdr_chunk is None:
+                ihdr_chunk = self.__read_chunk(location, IHDRChunk)
+            elif location.ctype == ChunkType.gAMA.name and gamma_chunk is None:
+                gamma_chunk = self.__read_chunk(location, GammaChunk)
+
+        if ihdr_chunk is None:
+            raise PngError('IHDR chunk is missing')
+
+        return ImageInfo(
+            image_format='PNG',
+            width=ihdr_chunk.width,
+            height=ihdr_chunk.height,
+            bit_depth=ihdr_chunk.bit_depth,
+            channels=config.PNG_CHANNELS.get(ihdr_chunk.color_type, 0),
+            gamma=gamma_chunk.get_gamma() if gamma_chunk else None,
+        )
+
+    def iter_rows(self) -> typing.Iterator[bytearray]:
+        """ Streams unfiltered scanlines, IDAT chunks are decompressed as they are read.
+
+        The rows are read from a mapping of their own, so they can still be consumed
+        after the file is closed.
+        """
+
+        index = self.index_chunks()
+        ihdr_location = next((c for c in index if c.ctype == ChunkType.IHDR.name), None)
+        if ihdr_location is None:
+            raise PngError('IHDR chunk is missing')
+
+        idat_locations = [c for c in index if c.ctype == ChunkType.IDAT.name]
+        if not idat_locations:
+            raise PngError('IDAT chunk is missing')
+
+        ihdr_chunk = self.__read_chunk(ihdr_location, IHDRChunk)
+        if ihdr_chunk.interlace_method == 1:
+            raise PngError('Interlaced images can not be streamed by rows')
+
+        mapped = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.__iter_rows(mapped, idat_locations, ihdr_chunk)
+
+    @staticmethod
+    def __iter_rows(
+        mapped: mmap.mmap,
+        idat_locations: typing.List[ChunkLocation],
+        ihdr_chunk: IHDRChunk,
+    ) -> typing.Iterator[bytearray]:
+        try:
+            yield from iter_scanlines(
+                chunks=(mapped[c.offset:c.offset + c.length] for c in idat_locations),
+                row_size=ihdr_chunk.row_size,
+                height=ihdr_chunk.height,
+                bpp=ihdr_chunk.bpx,
+            )
+        finally:
+            mapped.close()
+
     def read_for_ui(self) -> PngFileUI:
         """ https://docs.fileformat.com/image/png/ """
 
-        _ = self.__read_header()
         ihdr_chunk, iend_chunk = None, None
         idat_chunks, ancillary_chunks = [], []
-        while True:
-            chunk = self.__read_chunk()
-            if chunk.ctype == ChunkType.IHDR:
+        for location in self.index_chunks():
+            if location.ctype not in ChunkType.__members__:
+                # lowercase first letter marks an ancillary chunk, it is safe to skip
+                if location.ctype[0].isupper():
+                    raise PngChunkTypeError(f'Unknown critical chunk: {location.ctype}')
+
+                continue
+
+            if location.ctype == ChunkType.IHDR.name:
                 if ihdr_chunk is not None:
                     raise PngError('Only one IHDR chunk is allowed')
 
-                ihdr_chunk = IHDRChunk(
-                    length=chunk.length,
-                    ctype=chunk.ctype.name,
-                    data=chunk.data,
-                    crc=chunk.crc,
-                )
+                ihdr_chunk = self.__read_chunk(location, IHDRChunk)
                 continue
 
-            if chunk.ctype == ChunkType.gAMA:
-                ancillary_chunks.append(GammaChunk(
-                    length=chunk.length,
-                    ctype=chunk.ctype.name,
-                    data=chunk.data,
-                    crc=chunk.crc,
-                ))
+            if location.ctype == ChunkType.gAMA.name:
+                ancillary_chunks.append(self.__read_chunk(location, GammaChunk))
                 continue
 
-            if chunk.ctype == ChunkType.IEND:
-                if iend_chunk is not None:
-                    raise PngError('Only one IEND chunk is allowed')
-
-                iend_chunk = chunk
-                break
+            if location.ctype == ChunkType.IEND.name:
+                iend_chunk = self.__read_chunk(location)
+                continue
 
-            if chunk.ctype == ChunkType.IDAT:
-                idat_chunks.append(chunk)
+            if location.ctype == ChunkType.IDAT.name:
+                idat_chunks.append(self.__read_chunk(location))
                 continue
 
-            ancillary_chunks.append(chunk)
+            ancillary_chunks.append(self.__read_chunk(location))
+
+        if ihdr_chunk is None:
+            raise PngError('IHDR chunk is missing')
 
         return PngFileUI(
             ihdr_chunk=ihdr_chunk,
@@ -77,39 +182,34 @@ class PngIO:
             iend_chunk=iend_chunk,
         )
 
-    def __read_header(
-        self,
-    ) -> typing.List[int]:
-        return self.__read_bytes(self.HEADER_BYTES_COUNT)
-
-    def __read_bytes(
-        self,
-        cnt: int,
-    ) -> typing.List[int]:
-        return list(self.__file.read(cnt))
+    def __map(self) -> mmap.mmap:
+        if self.__mapped is None:
+            try:
+                self.__mapped = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PngError('Empty file')
 
-    def __read_bytes_as_string(
-        self,
-        cnt: int,
-    ) -> str:
-        return ''.join(map(chr, self.__read_bytes(cnt)))
+        return self.__mapped
 
-    def __read_bytes_as_hex(
+    def __read_body(
         self,
-        cnt: int,
-    ):
-        return ''.join(map(lambda x: f'{x:02x}', self.__read_bytes(cnt)))
+        location: ChunkLocation,
+    ) -> bytes:
+        # a copy out of the mapping, chunks outlive the file when it is closed
+        return self.__map()[location.offset:location.offset + location.length]
 
     def __read_chunk(
         self,
+        location: ChunkLocation,
+        chunk_class: typing.Type[Chunk] = Chunk,
     ) -> Chunk:
-        chunk_length = get_chunk_length(self.__read_bytes(Chunk.LENGTH_BYTES_COUNT))
-
-        return Chunk(
-            length=chunk_length,
-            ctype=self.__read_bytes_as_string(Chunk.TYPE_BYTES_COUNT),
-            data=self.__read_bytes(chunk_length),
-            crc=self.__read_bytes_as_hex(Chunk.CRC_BYTES_COUNT),
+        crc_offset = location.offset + location.length
+        (crc,) = struct.unpack_from('>I', self.__map(), crc_offset)
+        return chunk_class(
+            length=location.length,
+            ctype=location.ctype,
+            data=self.__read_body(location),
+            crc=crc,
         )
 
     def write(
@@ -123,7 +223,59 @@ class PngIO:
         filter_method: int = 0,
         interlace_method: int = 0,
         gamma: float = 2.2,
+        filter_type: typing.Optional[int] = None,
+        compression_level: typing.Optional[int] = None,
+        compression_strategy: typing.Optional[int] = None,
+        idat_chunk_size: int = IDAT_CHUNK_SIZE,
+        profile: CompressionProfile = CompressionProfile.DEFAULT,
+        workers: int = 1,
+        palette: typing.Optional[bytes] = None,
+        transparency: typing.Optional[bytes] = None,
     ):
+        """ `data` is packed scanlines without filter type bytes, `palette` and
+        `transparency` are bodies of PLTE and tRNS chunks. With `interlace_method`
+        1 the scanlines are reordered into Adam7 passes.
+
+        `profile` gives the compression level, zlib strategy and filter type,
+        each of them can be overridden by the corresponding argument.
+
+        `filter_type` is one of the PNG filter types for every scanline or
+        FILTER_ADAPTIVE to pick it per scanline by the minimum sum of absolute
+        differences. Only the MAX profile filters adaptively, it tries all five
+        filters on every scanline and takes several times longer. IDAT chunks are at most `idat_chunk_size` bytes long.
+        With more than one of `workers` the image data is deflated in parallel
+        blocks, the output is slightly larger but scales with the CPU cores.
+        """
+
+        level, strategy, profile_filter_type = COMPRESSION_PROFILES[profile]
+        compression_level = level if compression_level is None else compression_level
+        compression_strategy = strategy if compression_strategy is None else compression_strategy
+        filter_type = profile_filter_type if filter_type is None else filter_type
+
+        if filter_type != FILTER_ADAPTIVE and filter_type not in FILTER_TYPES:
+            raise PngError(f'Invalid filter type: {filter_type}')
+
+        if not -1 <= compression_level <= 9:
+            raise PngError(f'Invalid compression level: {compression_level}')
+
+        if compression_strategy not in COMPRESSION_STRATEGIES:
+            raise PngError(f'Invalid compression strategy: {compression_strategy}')
+
+        if not 0 < idat_chunk_size <= MAX_CHUNK_SIZE:
+            raise PngError(f'Invalid IDAT chunk size: {idat_chunk_size}')
+
+        if workers < 1:
+            raise PngError(f'Invalid number of workers: {workers}')
+
+        if bit_depth not in config.PNG_BIT_DEPTHS.get(color_type, ()):
+            raise PngError(f'Invalid bit depth {bit_depth} for color type {color_type}')
+
+        if interlace_method not in (0, 1):
+            raise PngError(f'Invalid interlace method: {interlace_method}')
+
+        if color_type == 3 and not palette:
+            raise PngError('Palette is required for indexed color')
+
         self.__write_file_signature()
         self.__write_ihdr(
             width=width,
@@ -135,15 +287,41 @@ class PngIO:
             interlace_method=interlace_method,
         )
         self.__write_gamma(gamma)
-
-        bpx = 3 if color_type == 2 else 1
-        self.__write_idat(data, width, bpx)
+        if palette:
+            self.__write_chunk(b'PLTE', bytes(palette))
+
+        if transparency:
+            self.__write_chunk(b'tRNS', bytes(transparency))
+
+        channels = config.PNG_CHANNELS[color_type]
+        bpx = max(1, channels * bit_depth // 8)
+        row_size = (width * channels * bit_depth + 7) // 8
+        if interlace_method == 1:
+            samples = unpack_samples(bytearray(data), bit_depth, width * channels, row_size)
+            filtered = itertools.chain.from_iterable(
+                iter_filtered_scanlines(
+                    [pack_samples(row, bit_depth, len(row)) for row in rows], bpx, filter_type
+                )
+                for rows in gather_passes(samples, width, height, channels)
+            )
+        else:
+            scanlines = self.__split_data_by_scanlines(data, row_size)
+            filtered = iter_filtered_scanlines(scanlines, bpx, filter_type)
+
+        if workers > 1:
+            compressed = parallel_deflate(
+                filtered, compression_level, compression_strategy, workers
+            )
+        else:
+            compressed = deflate(filtered, compression_level, compression_strategy)
+
+        self.__write_idat(compressed, idat_chunk_size)
         self.__write_iend()
 
     def __write_file_signature(
         self,
     ):
-        self.__file.write(b'\x89PNG\r\n\x1a\n')  # type: ignore
+        self.__file.write(self.SIGNATURE)  # type: ignore
 
     def __write_ihdr(
         self,
@@ -173,31 +351,35 @@ class PngIO:
 
     def __write_idat(
         self,
-        data: bytes,
-        width: int,
-        bpx: int,
+        pieces: typing.Iterable[bytes],
+        chunk_size: int,
     ):
-        scanlines = self.__split_data_by_scanlines(data, width * bpx)
-        filtered_scanlines = self.__apply_filters(scanlines, b'\x00')
-        compressed_data = zlib.compress(filtered_scanlines)
-        self.__write_chunk(b'IDAT', compressed_data)
+        """ Writes every IDAT chunk as soon as enough compressed data is produced. """
 
-    @staticmethod
-    def __apply_filters(
-        scanlines: typing.List[bytes],
-        filter_type: bytes,
-    ) -> bytes:
-        return b''.join([
-            filter_type + scanline
-            for scanline in scanlines
-        ])
+        compressed = bytearray()
+        for piece in pieces:
+            compressed += piece
+            self.__write_idat_chunks(compressed, chunk_size)
+
+        if compressed:
+            self.__write_chunk(b'IDAT', bytes(compressed))
+
+    def __write_idat_chunks(
+        self,
+        compressed: bytearray,
+        chunk_size: int,
+    ):
+        written = len(compressed) - len(compressed) % chunk_size
+        for begin in range(0, written, chunk_size):
+            self.__write_chunk(b'IDAT', bytes(compressed[begin:begin + chunk_size]))
+
+        del compressed[:written]
 
     @staticmethod
     def __split_data_by_scanlines(
         data: bytes,
-        width: int,
+        scanline_size: int,
     ) -> typing.List[bytes]:
-        scanline_size = width
         return [
             data[i:i + scanline_size]
             for i in range(0, len(data), scanline_size)
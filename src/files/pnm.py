@@ -1,19 +1,48 @@
+import itertools
+import mmap
+import string
+import sys
 import typing
+from array import array
 
 from src import config
 from src.entities.pnm import PnmFile, PnmFileUI
-from src.errors.pnm import PnmError, PnmSizeError
+from src.entities.probe import ImageInfo
+from src.errors.pnm import PnmError, PnmSizeError, PnmColorError, PnmFormatError
 from src.validators.pnm import (
     validate_max_color,
     validate_width_and_height,
     validate_pnm_format,
     validate_file,
     validate_image_content, validate_color_value,
+    validate_tuple_type,
 )
 
+# P1 and P4 store "1" for black, samples are turned into a graymap with max color 1
+_PLAIN_BITS = bytes.maketrans(b'01', b'\x01\x00')
+_UNPACKED_BITS = [
+    bytes(1 - (byte >> bit & 1) for bit in range(7, -1, -1))
+    for byte in range(256)
+]
+
+
+def _is_byte_buffer(
+    content: typing.Any,
+) -> bool:
+    """ Whether the raw memory of the content is a body of 8-bit samples. """
+
+    if isinstance(content, (bytes, bytearray)):
+        return True
+
+    if isinstance(content, memoryview):
+        return content.format == 'B'
+
+    return isinstance(content, array) and content.typecode == 'B'
+
 
 class PnmIO:
     __pnm_file: PnmFile
+    __rows_left: int = 0
 
     def __init__(
         self,
@@ -42,34 +71,156 @@ class PnmIO:
         self.__file.close()
         self.__file = None
 
+        if exc_type is None and self.__rows_left:
+            raise PnmSizeError("Not all rows were written")
+
     def read(
         self,
     ) -> PnmFile:
         self.__pnm_file = PnmFile()
         validate_file(self.__file)  # type: ignore
         self.__read_header()
-        self.__pnm_file.content = self.__file.read(self.__pnm_file.get_size())
+        self.__pnm_file.content = self.__read_samples()
+        return self.__pnm_file
 
-        if self.__file.read(1):
+    def probe(
+        self,
+    ) -> ImageInfo:
+        """ Parses the header only, the body is never read. """
+
+        self.__pnm_file = PnmFile()
+        validate_file(self.__file)  # type: ignore
+        self.__read_header()
+        return ImageInfo(
+            image_format=self.__pnm_file.pnm_format,
+            width=self.__pnm_file.width,
+            height=self.__pnm_file.height,
+            bit_depth=self.__pnm_file.max_color.bit_length(),
+            channels=self.__pnm_file.bytes_per_pixel,
+        )
+
+    def read_mapped(
+        self,
+    ) -> PnmFile:
+        """ Maps the file into memory instead of copying the body.
+
+        The content is a read-only memoryview that starts right after the header,
+        pages are loaded by the OS only when the pixels are touched. The view stays
+        valid after the file is closed. Samples of 16-bit files are left big-endian
+        as stored, two bytes each.
+        """
+
+        self.__pnm_file = PnmFile()
+        validate_file(self.__file)  # type: ignore
+        self.__read_header()
+        if self.__pnm_file.pnm_format not in config.PNM_RAW_FORMATS:
+            raise PnmFormatError('Format "%s" can not be mapped' % self.__pnm_file.pnm_format)
+
+        offset, size = self.__file.tell(), self.__pnm_file.get_body_size()
+        mapped = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) - offset != size:
+            mapped.close()
             raise PnmSizeError("Wrong file size in header")
 
+        self.__pnm_file.content = memoryview(mapped)[offset:offset + size]
         return self.__pnm_file
 
-    def read_for_ui(
+    def iter_rows(
         self,
-    ) -> PnmFileUI:
+        strip_height: int = 1,
+    ) -> typing.Iterator[PnmFile]:
+        """ Reads the body by strips of `strip_height` rows.
+
+        Every strip is a separate `PnmFile` with its own height, so the memory
+        needed depends on the strip size only.
+        """
+
+        if strip_height <= 0:
+            raise PnmSizeError('Invalid strip height "%s"' % strip_height)
+
         self.__pnm_file = PnmFile()
         validate_file(self.__file)  # type: ignore
         self.__read_header()
+        if self.__pnm_file.pnm_format in config.PNM_PLAIN_FORMATS:
+            raise PnmFormatError('Plain format "%s" can not be read by rows' % (
+                self.__pnm_file.pnm_format
+            ))
 
-        self.__pnm_file.content = [
-            ord(self.__file.read(1)) / 255
-            for _ in range(self.__pnm_file.get_size())
-        ]
+        header = self.__pnm_file
+        row_size = header.get_row_size()
+        for top in range(0, header.height, strip_height):
+            height = min(strip_height, header.height - top)
+            body = self.__file.read(height * row_size)
+            if len(body) != height * row_size:
+                raise PnmSizeError("Wrong file size in header")
+
+            yield PnmFile().create(
+                pnm_format=header.pnm_format,
+                width=header.width,
+                height=height,
+                max_color=header.max_color,
+                bytes_per_pixel=header.bytes_per_pixel,
+                content=self.__decode_body(body),
+                tuple_type=header.tuple_type,
+            )
 
         if self.__file.read(1):
             raise PnmSizeError("Wrong file size in header")
 
+    def iter_frames(
+        self,
+        reuse_buffer: bool = False,
+    ) -> typing.Iterator[PnmFile]:
+        """ Yields the images stored one after another in the file, works with pipes too.
+
+        With `reuse_buffer` every body is read into the same buffer and the content
+        is a memoryview over it, so a frame is valid only until the next one is read.
+        """
+
+        validate_file(self.__file)  # type: ignore
+        buffer = bytearray()
+        while True:
+            while self.__file.peek(1)[:1].isspace():
+                self.__file.read(1)
+
+            if not self.__file.peek(1):
+                return
+
+            self.__pnm_file = PnmFile()
+            self.__read_header(rewind=False)
+            if self.__pnm_file.pnm_format in config.PNM_PLAIN_FORMATS:
+                raise PnmFormatError('Plain format "%s" can not be read by frames' % (
+                    self.__pnm_file.pnm_format
+                ))
+
+            size = self.__pnm_file.get_body_size()
+            if reuse_buffer:
+                if len(buffer) < size:
+                    buffer = bytearray(size)
+
+                body = memoryview(buffer)[:size]
+                read = self.__file.readinto(body)
+            else:
+                body = self.__file.read(size)
+                read = len(body)
+
+            if read != size:
+                raise PnmSizeError("Wrong file size in header")
+
+            self.__pnm_file.content = self.__decode_body(body)
+            yield self.__pnm_file
+
+    def read_for_ui(
+        self,
+    ) -> PnmFileUI:
+        self.__pnm_file = PnmFile()
+        validate_file(self.__file)  # type: ignore
+        self.__read_header()
+
+        self.__pnm_file.content = self.__decode_for_ui(
+            self.__read_samples(), self.__pnm_file.max_color
+        )
+
         return PnmFileUI(
             pnm_format=self.__pnm_file.pnm_format,
             width=self.__pnm_file.width,
@@ -77,40 +228,220 @@ class PnmIO:
             max_color=self.__pnm_file.max_color,
             bytes_per_px=self.__pnm_file.bytes_per_pixel,
             content=self.__pnm_file.content,
+            tuple_type=self.__pnm_file.tuple_type,
         )
 
+    def __read_body(
+        self,
+    ) -> bytes:
+        body = self.__file.read(self.__pnm_file.get_body_size())
+        if len(body) != self.__pnm_file.get_body_size() or self.__file.read(1):
+            raise PnmSizeError("Wrong file size in header")
+
+        return body
+
+    def __read_samples(
+        self,
+    ) -> typing.Union[bytes, array]:
+        pnm_format = self.__pnm_file.pnm_format
+        if pnm_format in config.PNM_PLAIN_FORMATS:
+            return self.__read_plain_samples()
+
+        return self.__decode_body(self.__read_body())
+
+    def __decode_body(
+        self,
+        body: typing.Union[bytes, memoryview],
+    ) -> typing.Union[bytes, memoryview, array]:
+        if self.__pnm_file.pnm_format in config.PNM_BITMAP_FORMATS:
+            return self.__unpack_bits(body, self.__pnm_file.width)
+
+        return self.__decode_samples(body, self.__pnm_file.max_color)
+
+    def __read_plain_samples(
+        self,
+    ) -> typing.Union[bytes, array]:
+        body = self.__file.read()
+        if self.__pnm_file.pnm_format in config.PNM_BITMAP_FORMATS:
+            # digits of the plain bitmap may go without separators, "1" is black
+            samples = body.translate(None, string.whitespace.encode('ascii'))
+            samples = samples.translate(_PLAIN_BITS)
+            if len(samples) != self.__pnm_file.get_size():
+                raise PnmSizeError("Wrong file size in header")
+
+            if samples and max(samples) > 1:
+                raise PnmColorError("Invalid plain bitmap content")
+
+            return samples
+
+        tokens = body.split()
+        if len(tokens) != self.__pnm_file.get_size():
+            raise PnmSizeError("Wrong file size in header")
+
+        try:
+            values = [int(token) for token in tokens]
+        except ValueError:
+            raise PnmColorError("Invalid plain image content")
+
+        if values:
+            if min(values) < 0:
+                raise PnmColorError("Invalid plain image content")
+
+            validate_color_value(max(values), self.__pnm_file.max_color)
+
+        if self.__pnm_file.max_color <= config.PNM_MAX_COLOR_8_BIT:
+            return bytes(values)
+
+        return array('H', values)
+
+    @staticmethod
+    def __unpack_bits(
+        body: typing.Union[bytes, memoryview],
+        width: int,
+    ) -> bytes:
+        unpacked = b''.join(map(_UNPACKED_BITS.__getitem__, body))
+        row_bytes = (width + 7) // 8
+        if width == row_bytes * 8:
+            return unpacked
+
+        # every row is padded to a whole byte, drop the padding bits
+        return b''.join(
+            unpacked[row:row + width]
+            for row in range(0, len(unpacked), row_bytes * 8)
+        )
+
+    @staticmethod
+    def __decode_samples(
+        body: typing.Union[bytes, memoryview],
+        max_color: int,
+    ) -> typing.Union[bytes, memoryview, array]:
+        if max_color <= config.PNM_MAX_COLOR_8_BIT:
+            return body
+
+        # 16-bit samples are big-endian, swap the whole buffer at once on little-endian hosts
+        samples = array('H')
+        samples.frombytes(body)
+        if sys.byteorder == 'little':
+            samples.byteswap()
+
+        return samples
+
+    @staticmethod
+    def __decode_for_ui(
+        samples: typing.Union[bytes, array],
+        max_color: int,
+    ) -> array:
+        # one lookup per sample done by `map` in C, values above max color are clamped
+        levels = config.PNM_MAX_COLOR_8_BIT if isinstance(samples, bytes) else config.PNM_MAX_COLOR
+        scale = [min(1.0, i / max_color) if max_color else 0.0 for i in range(levels + 1)]
+        return array('f', map(scale.__getitem__, samples))
+
     def __read_header(
         self,
+        rewind: bool = True,
     ):
-        self.__file.seek(0)
+        if rewind:
+            self.__file.seek(0)
+
         self.__pnm_file.pnm_format = self.__get_pnm_format()
+        if self.__pnm_file.pnm_format == config.P7:
+            self.__read_pam_header()
+            return
+
         self.__pnm_file.bytes_per_pixel = config.PNM_BYTES_PER_PIXEL[
             self.__pnm_file.pnm_format
         ]
         self.__pnm_file.width, self.__pnm_file.height = self.__get_file_size()
         self.__pnm_file.max_color = self.__get_max_color_value()
 
-    def __read_line(
+    def __read_pam_header(
+        self,
+    ):
+        """ http://netpbm.sourceforge.net/doc/pam.html """
+
+        fields, tuple_types = {}, []
+        while True:
+            line = self.__file.readline()
+            if not line:
+                raise PnmFormatError("PAM header is not terminated with ENDHDR")
+
+            key, _, value = line.decode('ascii', errors='replace').strip().partition(' ')
+            if not key or key.startswith('#'):
+                continue
+
+            if key == 'ENDHDR':
+                break
+
+            if key == 'TUPLTYPE':
+                tuple_types.append(value.strip())
+                continue
+
+            fields[key] = value.strip()
+
+        self.__pnm_file.width, self.__pnm_file.height = validate_width_and_height(
+            f"{fields.get('WIDTH')} {fields.get('HEIGHT')}"
+        )
+        self.__pnm_file.max_color = validate_max_color(fields.get('MAXVAL'))
+        self.__pnm_file.tuple_type = ' '.join(tuple_types) or None
+
+        try:
+            self.__pnm_file.bytes_per_pixel = int(fields.get('DEPTH'))
+        except (TypeError, ValueError):
+            raise PnmFormatError('Invalid depth "%s"' % fields.get('DEPTH'))
+
+        expected_depth = config.PAM_TUPLE_TYPES.get(self.__pnm_file.tuple_type)
+        if self.__pnm_file.bytes_per_pixel <= 0 or expected_depth not in (
+            None, self.__pnm_file.bytes_per_pixel,
+        ):
+            raise PnmFormatError('Invalid depth "%s" for tuple type "%s"' % (
+                self.__pnm_file.bytes_per_pixel, self.__pnm_file.tuple_type
+            ))
+
+    def __read_token(
         self,
     ) -> str:
-        return self.__file.readline().decode('utf-8').strip()  # type: ignore
+        """ Reads the next header token, whitespaces and `#` comments are skipped.
+
+        Exactly one whitespace after the token is consumed, as the spec requires
+        between the last header token and the body.
+        """
+
+        char = self.__file.read(1)
+        while char.isspace() or char == b'#':
+            if char == b'#':
+                self.__file.readline()
+
+            char = self.__file.read(1)
+
+        token = bytearray()
+        while char and not char.isspace() and char != b'#':
+            token += char
+            char = self.__file.read(1)
+
+        if char == b'#':
+            self.__file.readline()
+
+        return token.decode('ascii', errors='replace')
 
     def __get_pnm_format(
         self,
     ) -> str:
-        pnm_format = self.__read_line()
+        pnm_format = self.__read_token()
         return validate_pnm_format(pnm_format)
 
     def __get_file_size(
         self,
     ) -> typing.Tuple[int, int]:
-        file_size = self.__read_line()
+        file_size = f"{self.__read_token()} {self.__read_token()}"
         return validate_width_and_height(file_size)
 
     def __get_max_color_value(
         self,
     ) -> int:
-        max_color_value = self.__read_line()
+        if self.__pnm_file.pnm_format in config.PNM_BITMAP_FORMATS:
+            return 1
+
+        max_color_value = self.__read_token()
         return validate_max_color(max_color_value)
 
     def write(
@@ -118,8 +449,9 @@ class PnmIO:
         pnm_format: str,
         height: int,
         width: int,
-        image_content: typing.List[int],
+        image_content: typing.Union[bytes, bytearray, memoryview, array, typing.Sequence[int]],
         max_color_value: int = 255,
+        tuple_type: typing.Optional[str] = None,
     ):
         try:
             validate_file(self.__file)  # type: ignore
@@ -131,64 +463,112 @@ class PnmIO:
             width=width,
             height=height,
             pnm_format=pnm_format,
+            tuple_type=tuple_type,
         )
 
-        self.__write_header(
+        header = self.__encode_header(
             pnm_format=pnm_format,
             height=height,
             width=width,
             max_color_value=max_color_value,
+            tuple_type=tuple_type,
         )
-        self.__write_body(
+        body = self.__encode_body(
             image_content=image_content,
             max_color_value=max_color_value,
         )
 
-    def __write_header(
+        self.__file.write(header)  # type: ignore
+        self.__file.write(body)  # type: ignore
+
+    def write_header(
         self,
         pnm_format: str,
         height: int,
         width: int,
-        max_color_value: int,
+        max_color_value: int = 255,
+        tuple_type: typing.Optional[str] = None,
     ):
-        self.__write_pnm_format(pnm_format)
-        self.__write_file_size(width, height)
-        self.__write_max_color_value(max_color_value)
+        """ Starts an incremental write, the body is passed later with `write_rows`. """
 
-    def __write_body(
-        self,
-        image_content: typing.List[int],
-        max_color_value: int,
-    ):
-        for color_code in image_content:
-            validate_color_value(color_code, max_color_value)
-            color_code = max(0, min(color_code, max_color_value))
-            self.__file.write(color_code.to_bytes(1, 'big'))  # type: ignore
+        try:
+            validate_file(self.__file)  # type: ignore
+        except AttributeError:
+            raise PnmError("File is not opened")
 
-    def __write_line(
-        self,
-        line: typing.Union[str, int],
-    ):
-        return self.__file.write(f"{line}\n".encode('utf-8'))  # type: ignore
+        self.__file.write(self.__encode_header(  # type: ignore
+            pnm_format=pnm_format,
+            height=height,
+            width=width,
+            max_color_value=max_color_value,
+            tuple_type=tuple_type,
+        ))
+        self.__rows_left = height
+        self.__row_size = width * (
+            config.PAM_TUPLE_TYPES[tuple_type]
+            if pnm_format == config.P7
+            else config.PNM_BYTES_PER_PIXEL[pnm_format]
+        )
+        self.__max_color_value = max_color_value
 
-    def __write_pnm_format(
+    def write_rows(
         self,
-        pnm_format: str,
+        image_content: typing.Union[bytes, bytearray, memoryview, array, typing.Sequence[int]],
     ):
-        validate_pnm_format(pnm_format)
-        self.__write_line(pnm_format)
+        if not self.__rows_left:
+            raise PnmError("Header is not written or all rows are already written")
 
-    def __write_file_size(
-        self,
-        width: int,
+        height, rest = divmod(len(image_content), self.__row_size)
+        if rest or not height or height > self.__rows_left:
+            raise PnmSizeError('Invalid image content size')
+
+        self.__file.write(self.__encode_body(  # type: ignore
+            image_content=image_content,
+            max_color_value=self.__max_color_value,
+        ))
+        self.__rows_left -= height
+
+    @staticmethod
+    def __encode_header(
+        pnm_format: str,
         height: int,
-    ):
+        width: int,
+        max_color_value: int,
+        tuple_type: typing.Optional[str] = None,
+    ) -> bytes:
+        validate_pnm_format(pnm_format, config.PNM_WRITABLE_FORMATS)
         validate_width_and_height((width, height))
-        self.__write_line(f"{width} {height}")
+        validate_max_color(max_color_value)
+        if pnm_format != config.P7:
+            return f"{pnm_format}\n{width} {height}\n{max_color_value}\n".encode('utf-8')
 
-    def __write_max_color_value(
-        self,
+        return (
+            f"{pnm_format}\nWIDTH {width}\nHEIGHT {height}\n"
+            f"DEPTH {validate_tuple_type(tuple_type)}\nMAXVAL {max_color_value}\n"
+            f"TUPLTYPE {tuple_type}\nENDHDR\n"
+        ).encode('utf-8')
+
+    @staticmethod
+    def __encode_body(
+        image_content: typing.Union[bytes, bytearray, memoryview, array, typing.Sequence[int]],
         max_color_value: int,
-    ):
-        validate_max_color(max_color_value)
-        self.__write_line(max_color_value)
+    ) -> bytes:
+        is_buffer = _is_byte_buffer(image_content)
+        if is_buffer and max_color_value == config.PNM_MAX_COLOR_8_BIT:
+            return bytes(image_content)
+
+        # min and max walk the whole buffer in C, clamping is needed only for negative values
+        lowest, highest = min(image_content), max(image_content)
+        validate_color_value(highest, max_color_value)
+        if lowest < 0:
+            image_content = map(max, image_content, itertools.repeat(0))
+
+        if max_color_value <= config.PNM_MAX_COLOR_8_BIT:
+            # wider arrays and views would be copied as their raw memory
+            return bytes(image_content if is_buffer else iter(image_content))
+
+        samples = array('H', iter(image_content))
+        if sys.byteorder == 'little':
+            samples.byteswap()
+
+        return samples.tobytes()
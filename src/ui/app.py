@@ -116,7 +116,7 @@ class ApplicationWindow(QMainWindow):
             GammaOption.ASSIGN
         )
 
-        if self.preview.get_selected_file_format() == config.P5:
+        if config.PNM_RAW_FORMAT_OF[self.preview.get_selected_file_format()] == config.P5:
             self.channels[1].setEnabled(False)
             self.channels[2].setEnabled(False)
         else:
@@ -160,7 +160,7 @@ class ApplicationWindow(QMainWindow):
         ):
             self.selected_file = file_name
 
-        if self.preview.get_selected_file_format() == config.P5:
+        if config.PNM_RAW_FORMAT_OF[self.preview.get_selected_file_format()] == config.P5:
             self.channels[1].setEnabled(False)
             self.channels[2].setEnabled(False)
         else:
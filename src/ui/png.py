@@ -1,4 +1,5 @@
 from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QPixmap
 from PyQt6.QtWidgets import (
     QMainWindow, QVBoxLayout, QLabel, QWidget, QFileDialog, QApplication
 )
@@ -51,24 +52,52 @@ class PngViewWidget(QMainWindow):
         except PngError as e:
             FileErrorMessage(str(e), self, logs).show()
             return
-        self.png_label.setPixmap(png.to_qpixmap())
+
+        # pass previews process events, another open or save must not start meanwhile
+        self.toolbar.setEnabled(False)
+        try:
+            self.png_label.setPixmap(png.to_qpixmap(on_pass=self.show_pass_preview))
+        finally:
+            self.toolbar.setEnabled(True)
 
         self.previous_png = png
 
+    def show_pass_preview(
+        self,
+        pixmap: QPixmap,
+    ):
+        """ Shows the image decoded so far while the next Adam7 passes are read. """
+
+        self.png_label.setPixmap(pixmap)
+        QApplication.processEvents()
+
     def save_png(self):
         if not self.previous_png:
             return
 
-        image = self.png_label.pixmap().toImage()
+        # the pixmap holds 8-bit samples, palette and sub-byte images are saved expanded
+        has_alpha = self.previous_png.has_alpha()
+        is_gray = self.previous_png.ihdr_chunk.color_type in (0, 4)
+        image = self.png_label.pixmap().toImage().convertToFormat(
+            QImage.Format.Format_RGBA8888 if has_alpha else QImage.Format.Format_RGB888
+        )
         width, height = image.width(), image.height()
 
-        # todo: support other formats
-        bpx = 3 if self.previous_png.ihdr_chunk.color_type == 2 else 1
-        pxls = bytes([
-            pxl for y in range(height)
-            for x in range(width)
-            for pxl in image.pixelColor(x, y).getRgb()[:bpx]
-        ])
+        channels = 4 if has_alpha else 3
+        bits = image.constBits().asstring(image.sizeInBytes())
+        stride, row_size = image.bytesPerLine(), width * channels
+        pxls = b''.join(
+            bits[y * stride:y * stride + row_size]
+            for y in range(height)
+        )
+        if is_gray and has_alpha:
+            gray_alpha = bytearray(width * height * 2)
+            gray_alpha[0::2], gray_alpha[1::2] = pxls[0::4], pxls[3::4]
+            pxls, color_type = bytes(gray_alpha), 4
+        elif is_gray:
+            pxls, color_type = pxls[0::3], 0
+        else:
+            color_type = 6 if has_alpha else 2
 
         new_file_name = QFileDialog.getSaveFileName(
             self, "Save PNG file", "", "PNG (*.png)"
@@ -86,11 +115,7 @@ class PngViewWidget(QMainWindow):
                 w.write(
                     width=width,
                     height=height,
-                    bit_depth=self.previous_png.ihdr_chunk.bit_depth,
-                    color_type=self.previous_png.ihdr_chunk.color_type,
-                    compression_method=self.previous_png.ihdr_chunk.compression_method,
-                    filter_method=self.previous_png.ihdr_chunk.filter_method,
-                    interlace_method=self.previous_png.ihdr_chunk.interlace_method,
+                    color_type=color_type,
                     data=pxls,
                     gamma=gamma,
                 )
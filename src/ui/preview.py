@@ -1,12 +1,16 @@
+import typing
+
 from PyQt6 import QtGui
-from PyQt6.QtCore import Qt, QPoint, QSize
+from PyQt6.QtCore import Qt
 from PyQt6.QtWidgets import (
     QWidget,
     QLabel,
     QVBoxLayout,
 )
 
+from src import config
 from src.entities.pnm import PnmFileUI
+from src.errors.pnm import PnmError
 from src.files.pnm import PnmIO
 from src.typedef import logs
 from src.ui.errors import FileErrorMessage
@@ -67,31 +71,34 @@ class FilePreview(QWidget):
         img = apply_scaling(scaling_algo, img, new_width, new_height)
         displace(img, x_displacement, y_displacement)
 
-        px_map = QtGui.QPixmap(QSize(img.width, img.height))
-        painter = QtGui.QPainter(px_map)
-        converter = ColorConverter(new_color_format)
         dithering_bits_values = [
             i / (2 ** dithering_bits - 1)
             for i in range(2 ** dithering_bits)
         ]
 
-        for i in range(0, img.get_size(), img.bytes_per_px):
-            px = img.get_px(i, disabled_channels)
-            px_upd = converter.convert_px(prev_color_format, px)
-            px_upd = resolve_gamma(px_upd, prev_gamma, next_gamma, gamma_option)
-            img.set_px(i, px_upd)
-
-        for i in range(0, img.get_size(), img.bytes_per_px):
-            px = apply_dithering(dithering_algo, img, i, disabled_channels, dithering_bits_values)
-            painter.setPen(QtGui.QColor(*[
-                max(0, min(255, int(i * 255)))
-                for i in px
-            ]))
-
-            painter.drawPoint(QPoint(img.get_x(i), img.get_y(i)))
-            img.set_px(i, px)
-
-        painter.end()
+        channels = ColorConverter.convert_channels(
+            img.get_rgb_channels(disabled_channels), prev_color_format, new_color_format
+        )
+        img.set_color_channels([
+            resolve_gamma(channel, prev_gamma, next_gamma, gamma_option)
+            for channel in channels
+        ])
+
+        if dithering_algo != DitheringAlgo.NONE or any(disabled_channels):
+            for i in range(0, img.get_size(), img.bytes_per_px):
+                px = apply_dithering(
+                    dithering_algo, img, i, disabled_channels, dithering_bits_values
+                )
+                img.set_px(i, px)
+
+        image = QtGui.QImage(
+            bytes(img.to_rgb888()),
+            img.width,
+            img.height,
+            img.width * 3,
+            QtGui.QImage.Format.Format_RGB888,
+        )
+        px_map = QtGui.QPixmap.fromImage(image)
         self.label.setPixmap(px_map)
         self.prev_correct_image = img
         return True
@@ -105,29 +112,48 @@ class FilePreview(QWidget):
             FileErrorMessage("No image to save", self, logs).show()
             return
 
-        opt_content = try_delete_superfluous_channels(
-            self.prev_correct_image.content, disabled_channels
-        )
+        if self.prev_correct_image.bytes_per_px == 3:
+            opt_content = try_delete_superfluous_channels(
+                self.prev_correct_image.content, disabled_channels
+            )
 
-        if len(opt_content) != len(self.prev_correct_image.content):
-            self.prev_correct_image.content = opt_content
-            self.prev_correct_image.bytes_per_px = 1
-            self.prev_correct_image.pnm_format = "P5"
-            logs.info("Channels deleted, changed format to P5")
+            if len(opt_content) != len(self.prev_correct_image.content):
+                self.prev_correct_image.content = opt_content
+                self.prev_correct_image.bytes_per_px = 1
+                self.prev_correct_image.pnm_format = "P5"
+                logs.info("Channels deleted, changed format to P5")
 
+        max_color = self.prev_correct_image.max_color
         integers_content = [
-            max(0, min(255, int(i * 255)))
+            max(0, min(max_color, round(i * max_color)))
             for i in self.prev_correct_image.content
         ]
 
-        with PnmIO(save_as, "wb") as w:
-            w.write(
-                pnm_format=self.prev_correct_image.pnm_format,
-                width=self.prev_correct_image.width,
-                height=self.prev_correct_image.height,
-                image_content=integers_content,
-                max_color_value=self.prev_correct_image.max_color,
-            )
+        try:
+            with PnmIO(save_as, "wb") as w:
+                w.write(
+                    pnm_format=config.PNM_RAW_FORMAT_OF[self.prev_correct_image.pnm_format],
+                    width=self.prev_correct_image.width,
+                    height=self.prev_correct_image.height,
+                    image_content=integers_content,
+                    max_color_value=self.prev_correct_image.max_color,
+                    tuple_type=self.get_tuple_type(),
+                )
+        except PnmError as e:
+            FileErrorMessage(str(e), self, logs).show()
+
+    def get_tuple_type(self) -> typing.Optional[str]:
+        """ PAM tuple type of the image, the one matching its depth if it has none or another. """
+
+        tuple_type = self.prev_correct_image.tuple_type
+        bytes_per_px = self.prev_correct_image.bytes_per_px
+        if config.PAM_TUPLE_TYPES.get(tuple_type) == bytes_per_px:
+            return tuple_type
+
+        return next(
+            (name for name, depth in config.PAM_TUPLE_TYPES.items() if depth == bytes_per_px),
+            tuple_type,
+        )
 
     def get_selected_file_format(self):
         return self.prev_correct_image.pnm_format
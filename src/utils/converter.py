@@ -1,6 +1,14 @@
+import functools
+import itertools
+import operator
 import typing
+from array import array
 from enum import Enum
 
+from src import config
+
+Channels = typing.List[typing.List[float]]
+
 
 class ColorFormat(Enum):
     RGB = 0
@@ -12,7 +20,49 @@ class ColorFormat(Enum):
     CMY = 6
 
 
+def _scale(
+    values: typing.Iterable[float],
+    factor: float,
+) -> typing.Iterator[float]:
+    return map(operator.mul, values, itertools.repeat(factor))
+
+
+def _shift(
+    values: typing.Iterable[float],
+    offset: float,
+) -> typing.Iterator[float]:
+    return map(operator.add, values, itertools.repeat(offset))
+
+
+def _nonzero(
+    values: typing.Sequence[float],
+) -> typing.Iterator[float]:
+    """ Replaces zeros with ones, so the values are safe to divide by. """
+
+    # `not value` is 1 for zeros, it picks the 1.0 of the pair instead of the value
+    return map(operator.getitem, zip(values, itertools.repeat(1.0)), map(operator.not_, values))
+
+
+def _select(
+    choices: typing.Iterable[tuple],
+    indices: typing.Iterable[int],
+) -> typing.Iterator[float]:
+    return map(operator.getitem, choices, indices)
+
+
+def _snap_zero(
+    value: float,
+) -> float:
+    return 0.0 if abs(value) < 1e-12 else value
+
+
 class HueBasedConverter:
+    # which of (c, x, 0) goes to every channel in each of the six hue sectors
+    SECTOR_CHANNELS = ((0, 1, 2, 2, 1, 0), (1, 0, 0, 1, 2, 2), (2, 2, 1, 0, 0, 1))
+    # hue candidate to take by `2 * (r is max) + (g is max)`: blue, green, red, red
+    MAX_CHANNEL_HUE = (2, 1, 0, 0)
+    # sector of `hue // 60`, 360 and anything out of range falls back to the last one
+    SECTORS = {float(i): i for i in range(6)}
 
     @classmethod
     def count_hue(
@@ -57,6 +107,74 @@ class HueBasedConverter:
 
         return [r + m, g + m, b + m]
 
+    @classmethod
+    def count_hue_channels(
+        cls,
+        r: typing.Sequence[float],
+        g: typing.Sequence[float],
+        b: typing.Sequence[float],
+        c_max: typing.Sequence[float],
+        delta: typing.Sequence[float],
+    ) -> typing.List[float]:
+        """ `count_hue` of every pixel, each branch is computed for all of them and selected. """
+
+        # the hue of gray pixels is zeroed below, dividing them by 1 only keeps it finite
+        safe_delta = list(_nonzero(delta))
+        # (red is max, green is max, blue is max) branches of `count_hue` per pixel
+        candidates = zip(
+            map(operator.mod, map(operator.truediv, map(operator.sub, g, b), safe_delta),
+                itertools.repeat(6)),
+            _shift(map(operator.truediv, map(operator.sub, b, r), safe_delta), 2),
+            _shift(map(operator.truediv, map(operator.sub, r, g), safe_delta), 4),
+        )
+        # `count_hue` checks red first, a max shared with green still takes the red branch
+        max_channel = map(
+            operator.add,
+            _scale(map(operator.eq, r, c_max), 2),
+            map(operator.eq, g, c_max),
+        )
+        hue = _select(candidates, map(cls.MAX_CHANNEL_HUE.__getitem__, map(int, max_channel)))
+        hue = map(operator.mul, hue, map(bool, delta))
+        return list(map(operator.truediv, _scale(hue, 60), itertools.repeat(360)))
+
+    @classmethod
+    def convert_to_rgb_channels(
+        cls,
+        hue: typing.Iterable[float],
+        c: typing.Sequence[float],
+        x: typing.Sequence[float],
+        m: typing.Sequence[float],
+    ) -> Channels:
+        """ `convert_to_rgb` of every pixel, `hue` is in degrees. """
+
+        sectors = list(map(
+            cls.SECTORS.get, map(operator.floordiv, hue, itertools.repeat(60)), itertools.repeat(5)
+        ))
+        choices = list(zip(c, x, itertools.repeat(0)))
+        # every channel picks its component of (c, x, 0) by the sector of the pixel
+        return [
+            list(map(operator.add, _select(choices, map(indices.__getitem__, sectors)), m))
+            for indices in cls.SECTOR_CHANNELS
+        ]
+
+    @classmethod
+    def hue_channel_parts(
+        cls,
+        hue: typing.Iterable[float],
+        c: typing.Sequence[float],
+    ) -> typing.Tuple[typing.List[float], typing.List[float]]:
+        """ Hue in degrees and `x` of the hue to rgb conversion for every pixel. """
+
+        degrees = list(_scale(hue, 360))
+        # `x = c * (1 - |(h / 60) % 2 - 1|)`
+        distance = map(
+            abs,
+            _shift(map(operator.mod, map(operator.truediv, degrees, itertools.repeat(60)),
+                       itertools.repeat(2)), -1),
+        )
+        x = list(map(operator.mul, c, map(operator.sub, itertools.repeat(1), distance)))
+        return degrees, x
+
 
 class HslConverter(HueBasedConverter):
     @classmethod
@@ -86,6 +204,41 @@ class HslConverter(HueBasedConverter):
         m = l - c / 2
         return cls.convert_to_rgb(h, c, x, m)
 
+    @classmethod
+    def rgb_to_hsl_channels(
+        cls,
+        r: typing.Sequence[float],
+        g: typing.Sequence[float],
+        b: typing.Sequence[float],
+    ) -> Channels:
+        c_max, c_min = list(map(max, r, g, b)), list(map(min, r, g, b))
+        delta = list(map(operator.sub, c_max, c_min))
+        c_sum = list(map(operator.add, c_max, c_min))
+
+        h = cls.count_hue_channels(r, g, b, c_max, delta)
+        s = map(
+            operator.truediv,
+            delta,
+            _nonzero(list(map(operator.sub, itertools.repeat(1), map(abs, _shift(c_sum, -1))))),
+        )
+        s = list(map(operator.mul, s, map(bool, delta)))
+        l = list(map(operator.truediv, c_sum, itertools.repeat(2)))
+
+        return [h, s, l]
+
+    @classmethod
+    def hsl_to_rgb_channels(
+        cls,
+        h: typing.Sequence[float],
+        s: typing.Sequence[float],
+        l: typing.Sequence[float],
+    ) -> Channels:
+        lightness = map(abs, _shift(_scale(l, 2), -1))
+        c = list(map(operator.mul, map(operator.sub, itertools.repeat(1), lightness), s))
+        degrees, x = cls.hue_channel_parts(h, c)
+        m = map(operator.sub, l, map(operator.truediv, c, itertools.repeat(2)))
+        return cls.convert_to_rgb_channels(degrees, c, x, list(m))
+
 
 class HsvConverter(HueBasedConverter):
 
@@ -117,6 +270,34 @@ class HsvConverter(HueBasedConverter):
 
         return cls.convert_to_rgb(h, c, x, m)
 
+    @classmethod
+    def rgb_to_hsv_channels(
+        cls,
+        r: typing.Sequence[float],
+        g: typing.Sequence[float],
+        b: typing.Sequence[float],
+    ) -> Channels:
+        c_max = list(map(max, r, g, b))
+        delta = list(map(operator.sub, c_max, map(min, r, g, b)))
+
+        h = cls.count_hue_channels(r, g, b, c_max, delta)
+        s = map(operator.truediv, delta, _nonzero(c_max))
+        s = list(map(operator.mul, s, map(bool, c_max)))
+
+        return [h, s, c_max]
+
+    @classmethod
+    def hsv_to_rgb_channels(
+        cls,
+        h: typing.Sequence[float],
+        s: typing.Sequence[float],
+        v: typing.Sequence[float],
+    ) -> Channels:
+        c = list(map(operator.mul, v, s))
+        degrees, x = cls.hue_channel_parts(h, c)
+        m = map(operator.sub, v, c)
+        return cls.convert_to_rgb_channels(degrees, c, x, list(m))
+
 
 class YCbCrBased:
 
@@ -133,8 +314,8 @@ class YCbCrBased:
         cb = (b - y) / (2 * (1 - kb))
         cr = (r - y) / (2 * (1 - kr))
 
-        cb += 0.5
-        cr += 0.5
+        cb += config.CHROMA_CENTER
+        cr += config.CHROMA_CENTER
 
         return [y, cb, cr]
 
@@ -147,8 +328,8 @@ class YCbCrBased:
     ):
         y, cb, cr = pixel[0], pixel[1], pixel[2]
 
-        cb -= 0.5
-        cr -= 0.5
+        cb -= config.CHROMA_CENTER
+        cr -= config.CHROMA_CENTER
 
         r = y + 2 * (1 - kr) * cr
         g = y - kb / (1 - kb - kr) * 2 * (1 - kb) * cb - kr / (1 - kb - kr) * 2 * (1 - kr) * cr
@@ -156,6 +337,42 @@ class YCbCrBased:
 
         return [r, g, b]
 
+    @classmethod
+    def from_rgb_channels(
+        cls,
+        r: typing.Sequence[float],
+        g: typing.Sequence[float],
+        b: typing.Sequence[float],
+        kr: float,
+        kb: float,
+    ) -> Channels:
+        y = map(operator.add, _scale(r, kr), _scale(g, 1 - kr - kb))
+        y = list(map(operator.add, y, _scale(b, kb)))
+        cb = _scale(map(operator.sub, b, y), 1 / (2 * (1 - kb)))
+        cr = _scale(map(operator.sub, r, y), 1 / (2 * (1 - kr)))
+        cb, cr = _shift(cb, config.CHROMA_CENTER), _shift(cr, config.CHROMA_CENTER)
+
+        return [y, list(cb), list(cr)]
+
+    @classmethod
+    def to_rgb_channels(
+        cls,
+        y: typing.Sequence[float],
+        cb: typing.Sequence[float],
+        cr: typing.Sequence[float],
+        kr: float,
+        kb: float,
+    ) -> Channels:
+        cb = list(_shift(cb, -config.CHROMA_CENTER))
+        cr = list(_shift(cr, -config.CHROMA_CENTER))
+
+        r = map(operator.add, y, _scale(cr, 2 * (1 - kr)))
+        g = map(operator.sub, y, _scale(cb, kb / (1 - kb - kr) * 2 * (1 - kb)))
+        g = map(operator.sub, g, _scale(cr, kr / (1 - kb - kr) * 2 * (1 - kr)))
+        b = map(operator.add, y, _scale(cb, 2 * (1 - kb)))
+
+        return [list(r), list(g), list(b)]
+
 
 class YCbCr601Converter(YCbCrBased):
     kr = 0.299
@@ -175,6 +392,20 @@ class YCbCr601Converter(YCbCrBased):
     ):
         return cls.to_rgb(pixel, cls.kr, cls.kb)
 
+    @classmethod
+    def rgb_to_ycbcr601_channels(
+        cls,
+        *channels: typing.Sequence[float],
+    ) -> Channels:
+        return cls.from_rgb_channels(*channels, cls.kr, cls.kb)
+
+    @classmethod
+    def ycbcr601_to_rgb_channels(
+        cls,
+        *channels: typing.Sequence[float],
+    ) -> Channels:
+        return cls.to_rgb_channels(*channels, cls.kr, cls.kb)
+
 
 class YCoCgConverter:
 
@@ -189,8 +420,8 @@ class YCoCgConverter:
         co = r / 2 - b / 2
         cg = -r / 4 + g / 2 - b / 4
 
-        co += 0.5
-        cg += 0.5
+        co += config.CHROMA_CENTER
+        cg += config.CHROMA_CENTER
 
         return [y, co, cg]
 
@@ -201,8 +432,8 @@ class YCoCgConverter:
     ):
         y, co, cg = pixel[0], pixel[1], pixel[2]
 
-        co -= 0.5
-        cg -= 0.5
+        co -= config.CHROMA_CENTER
+        cg -= config.CHROMA_CENTER
 
         r = y + co - cg
         g = y + cg
@@ -210,6 +441,38 @@ class YCoCgConverter:
 
         return [r, g, b]
 
+    @classmethod
+    def rgb_to_ycocg_channels(
+        cls,
+        r: typing.Sequence[float],
+        g: typing.Sequence[float],
+        b: typing.Sequence[float],
+    ) -> Channels:
+        y = map(operator.add, _scale(r, 0.25), _scale(g, 0.5))
+        y = map(operator.add, y, _scale(b, 0.25))
+        co = map(operator.sub, _scale(r, 0.5), _scale(b, 0.5))
+        cg = map(operator.add, _scale(r, -0.25), _scale(g, 0.5))
+        cg = map(operator.sub, cg, _scale(b, 0.25))
+        co, cg = _shift(co, config.CHROMA_CENTER), _shift(cg, config.CHROMA_CENTER)
+
+        return [list(y), list(co), list(cg)]
+
+    @classmethod
+    def ycocg_to_rgb_channels(
+        cls,
+        y: typing.Sequence[float],
+        co: typing.Sequence[float],
+        cg: typing.Sequence[float],
+    ) -> Channels:
+        co = list(_shift(co, -config.CHROMA_CENTER))
+        cg = list(_shift(cg, -config.CHROMA_CENTER))
+
+        r = map(operator.sub, map(operator.add, y, co), cg)
+        g = map(operator.add, y, cg)
+        b = map(operator.sub, map(operator.sub, y, co), cg)
+
+        return [list(r), list(g), list(b)]
+
 
 class YCbCr709Converter(YCbCrBased):
     kr = 0.2126
@@ -229,6 +492,20 @@ class YCbCr709Converter(YCbCrBased):
     ):
         return cls.to_rgb(pixel, cls.kr, cls.kb)
 
+    @classmethod
+    def rgb_to_ycbcr709_channels(
+        cls,
+        *channels: typing.Sequence[float],
+    ) -> Channels:
+        return cls.from_rgb_channels(*channels, cls.kr, cls.kb)
+
+    @classmethod
+    def ycbcr709_to_rgb_channels(
+        cls,
+        *channels: typing.Sequence[float],
+    ) -> Channels:
+        return cls.to_rgb_channels(*channels, cls.kr, cls.kb)
+
 
 class CmyConverter:
 
@@ -246,8 +523,106 @@ class CmyConverter:
     ):
         return [1 - pixel[0], 1 - pixel[1], 1 - pixel[2]]
 
+    @classmethod
+    def invert_channels(
+        cls,
+        *channels: typing.Sequence[float],
+    ) -> Channels:
+        return [
+            list(map(operator.sub, itertools.repeat(1), channel))
+            for channel in channels
+        ]
+
+
+class AffineTransform:
+    """ Pixel conversion of the form `matrix @ px + offset`. """
+
+    def __init__(
+        self,
+        matrix: typing.Sequence[typing.Sequence[float]],
+        offset: typing.Sequence[float],
+    ):
+        # rounding residue of the composition would cost a pass over a channel
+        self.matrix = [[_snap_zero(factor) for factor in row] for row in matrix]
+        self.offset = [_snap_zero(value) for value in offset]
+
+    @classmethod
+    def of_function(
+        cls,
+        function: typing.Callable[[list[float]], list[float]],
+    ) -> 'AffineTransform':
+        """ Recovers the transform of an affine pixel function from its values at the basis. """
+
+        offset = function([0.0, 0.0, 0.0])
+        columns = [
+            [value - o for value, o in zip(function([float(i == j) for j in range(3)]), offset)]
+            for i in range(3)
+        ]
+        return cls([[column[row] for column in columns] for row in range(3)], offset)
+
+    def then(
+        self,
+        other: 'AffineTransform',
+    ) -> 'AffineTransform':
+        """ Single transform doing this one and then `other`. """
+
+        matrix = [
+            [sum(other.matrix[i][k] * self.matrix[k][j] for k in range(3)) for j in range(3)]
+            for i in range(3)
+        ]
+        offset = [
+            sum(other.matrix[i][k] * self.offset[k] for k in range(3)) + other.offset[i]
+            for i in range(3)
+        ]
+        return AffineTransform(matrix, offset)
+
+    def apply_channels(
+        self,
+        channels: typing.Sequence[typing.Sequence[float]],
+    ) -> Channels:
+        """ One pass over the channels for every output one, zero terms are skipped. """
+
+        size = len(channels[0])
+        converted = []
+        for row, offset in zip(self.matrix, self.offset):
+            terms = [
+                channel if factor == 1 else _scale(channel, factor)
+                for channel, factor in zip(channels, row)
+                if factor != 0
+            ]
+            if not terms:
+                converted.append([offset] * size)
+                continue
+
+            values = functools.reduce(lambda total, term: map(operator.add, total, term), terms)
+            converted.append(list(_shift(values, offset) if offset != 0 else values))
+
+        return converted
+
 
 class ColorConverter:
+    # formats where conversion to rgb is a matrix and an offset
+    AFFINE_FORMATS = (
+        ColorFormat.RGB, ColorFormat.CMY, ColorFormat.YCbCr601, ColorFormat.YCbCr709,
+        ColorFormat.YCoCg,
+    )
+    TO_RGB_CHANNELS = {
+        ColorFormat.HSL: HslConverter.hsl_to_rgb_channels,
+        ColorFormat.HSV: HsvConverter.hsv_to_rgb_channels,
+        ColorFormat.YCbCr601: YCbCr601Converter.ycbcr601_to_rgb_channels,
+        ColorFormat.YCbCr709: YCbCr709Converter.ycbcr709_to_rgb_channels,
+        ColorFormat.CMY: CmyConverter.invert_channels,
+        ColorFormat.YCoCg: YCoCgConverter.ycocg_to_rgb_channels,
+    }
+    FROM_RGB_CHANNELS = {
+        ColorFormat.HSL: HslConverter.rgb_to_hsl_channels,
+        ColorFormat.HSV: HsvConverter.rgb_to_hsv_channels,
+        ColorFormat.YCbCr601: YCbCr601Converter.rgb_to_ycbcr601_channels,
+        ColorFormat.YCbCr709: YCbCr709Converter.rgb_to_ycbcr709_channels,
+        ColorFormat.CMY: CmyConverter.invert_channels,
+        ColorFormat.YCoCg: YCoCgConverter.rgb_to_ycocg_channels,
+    }
+
     def __init__(
         self,
         convert_to: ColorFormat,
@@ -265,6 +640,73 @@ class ColorConverter:
         rgb_px = self._convert_to_rgb(convert_from, px, 3)
         return self._convert_from_rgb(self.convert_to, rgb_px, 3)
 
+    @classmethod
+    def convert_channels(
+        cls,
+        channels: typing.Sequence[typing.Sequence[float]],
+        convert_from: ColorFormat,
+        convert_to: ColorFormat,
+    ) -> typing.List[typing.Sequence[float]]:
+        """ Converts the whole image given as three separate channels. """
+
+        if convert_from == convert_to:
+            return list(channels)
+
+        if convert_from in cls.AFFINE_FORMATS and convert_to in cls.AFFINE_FORMATS:
+            return cls.get_affine_transform(convert_from, convert_to).apply_channels(channels)
+
+        if convert_from != ColorFormat.RGB:
+            channels = cls.__get_converter(cls.TO_RGB_CHANNELS, convert_from)(*channels)
+
+        if convert_to != ColorFormat.RGB:
+            channels = cls.__get_converter(cls.FROM_RGB_CHANNELS, convert_to)(*channels)
+
+        return channels
+
+    @classmethod
+    def convert_image(
+        cls,
+        content: typing.Union[array, typing.Sequence[float]],
+        convert_from: ColorFormat,
+        convert_to: ColorFormat,
+        bytes_per_pixel: int = 3,
+    ) -> array:
+        """ Converts an interleaved image, samples after the third one of a pixel are kept. """
+
+        converted = array('f', content)
+        channels = [converted[i::bytes_per_pixel] for i in range(3)]
+        for i, channel in enumerate(cls.convert_channels(channels, convert_from, convert_to)):
+            converted[i::bytes_per_pixel] = array('f', channel)
+
+        return converted
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def get_affine_transform(
+        cls,
+        convert_from: ColorFormat,
+        convert_to: ColorFormat,
+    ) -> AffineTransform:
+        """ Conversion between two affine formats fused into one transform, built once. """
+
+        to_rgb = AffineTransform.of_function(
+            lambda px: cls._convert_to_rgb(convert_from, px, 3)
+        )
+        from_rgb = AffineTransform.of_function(
+            lambda px: cls._convert_from_rgb(convert_to, px, 3)
+        )
+        return to_rgb.then(from_rgb)
+
+    @staticmethod
+    def __get_converter(
+        converters: dict,
+        color_format: ColorFormat,
+    ) -> typing.Callable[..., Channels]:
+        if color_format not in converters:
+            raise ValueError(f"Unsupported color format: {color_format}")
+
+        return converters[color_format]
+
     @classmethod
     def _convert_to_rgb(
         cls,
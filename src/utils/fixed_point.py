@@ -0,0 +1,477 @@
+import dataclasses
+import enum
+import functools
+import itertools
+import typing
+from array import array
+
+from src import config
+from src.entities.pnm import PnmFile
+from src.utils.converter import ColorFormat, YCbCr601Converter, YCbCr709Converter
+
+# fractional bits of the fixed-point coefficients
+FRACTION_BITS = 16
+# 8-bit chroma is centered at 128, like in JPEG, instead of 127.5 of the float formulas,
+# so neutral grays keep a chroma of exactly 128 and round trip unchanged
+CHROMA_CENTER = 128
+
+Bytes = typing.Union[bytes, bytearray, memoryview]
+Matrix = typing.Sequence[typing.Sequence[int]]
+
+_HALF = 1 << (FRACTION_BITS - 1)
+# saturated byte of values from -1024 to 1023, negative ones index from the end
+_SATURATED = bytes(range(256)) + b'\xff' * 768 + bytes(1024)
+_COEFFICIENTS = {
+    ColorFormat.YCbCr601: (YCbCr601Converter.kr, YCbCr601Converter.kb),
+    ColorFormat.YCbCr709: (YCbCr709Converter.kr, YCbCr709Converter.kb),
+}
+
+
+def _fixed(
+    value: float,
+) -> int:
+    return round(value * (1 << FRACTION_BITS))
+
+
+def _split(
+    pixels: Bytes,
+) -> typing.List[bytes]:
+    pixels = bytes(pixels)
+    return [pixels[channel::3] for channel in range(3)]
+
+
+def _join(
+    channels: typing.Sequence[Bytes],
+) -> bytearray:
+    pixels = bytearray(len(channels[0]) * 3)
+    for i, channel in enumerate(channels):
+        pixels[i::3] = channel
+
+    return pixels
+
+
+def _transform(
+    pixels: Bytes,
+    matrix: Matrix,
+    offsets: typing.Sequence[int],
+) -> bytearray:
+    """ `matrix @ px + offset` of packed 8-bit triplets in fixed point, rounded and saturated. """
+
+    colors = list(zip(*_split(pixels)))
+    return _join([
+        bytes([
+            _SATURATED[(kr * r + kg * g + kb * b + offset) >> FRACTION_BITS]
+            for r, g, b in colors
+        ])
+        for (kr, kg, kb), offset in zip(matrix, offsets)
+    ])
+
+
+@functools.lru_cache(maxsize=None)
+def _ycbcr_transforms(
+    color_format: ColorFormat,
+) -> typing.Tuple[Matrix, typing.List[int], Matrix, typing.List[int]]:
+    """ Fixed-point matrices and offsets of both directions, halves are added to round. """
+
+    kr, kb = _COEFFICIENTS[color_format]
+    kg = 1 - kr - kb
+    from_rgb = [
+        (kr, kg, kb),
+        (-kr / (2 * (1 - kb)), -kg / (2 * (1 - kb)), 0.5),
+        (0.5, -kg / (2 * (1 - kr)), -kb / (2 * (1 - kr))),
+    ]
+    to_rgb = [
+        (1, 0, 2 * (1 - kr)),
+        (1, -kb / kg * 2 * (1 - kb), -kr / kg * 2 * (1 - kr)),
+        (1, 2 * (1 - kb), 0),
+    ]
+
+    forward_offsets = [_HALF, _HALF + _fixed(CHROMA_CENTER), _HALF + _fixed(CHROMA_CENTER)]
+    # chroma inputs are centered before they are multiplied
+    backward_offsets = [_HALF - _fixed((kcb + kcr) * CHROMA_CENTER) for _, kcb, kcr in to_rgb]
+    return (
+        [[_fixed(k) for k in row] for row in from_rgb],
+        forward_offsets,
+        [[_fixed(k) for k in row] for row in to_rgb],
+        backward_offsets,
+    )
+
+
+def rgb_to_ycbcr(
+    rgb: Bytes,
+    color_format: ColorFormat = ColorFormat.YCbCr601,
+) -> bytearray:
+    """ Full range 8-bit YCbCr of packed 8-bit RGB with round half up. """
+
+    matrix, offsets, _, _ = _ycbcr_transforms(color_format)
+    return _transform(rgb, matrix, offsets)
+
+
+def ycbcr_to_rgb(
+    ycbcr: Bytes,
+    color_format: ColorFormat = ColorFormat.YCbCr601,
+) -> bytearray:
+    _, _, matrix, offsets = _ycbcr_transforms(color_format)
+    return _transform(ycbcr, matrix, offsets)
+
+
+def rgb_to_ycocg(
+    rgb: Bytes,
+) -> bytearray:
+    """ 8-bit YCoCg, its coefficients are exact in fixed point. """
+
+    quarter = 1 << (FRACTION_BITS - 2)
+    center = _fixed(CHROMA_CENTER)
+    matrix = [(quarter, 2 * quarter, quarter), (2 * quarter, 0, -2 * quarter),
+              (-quarter, 2 * quarter, -quarter)]
+    return _transform(rgb, matrix, [_HALF, _HALF + center, _HALF + center])
+
+
+def ycocg_to_rgb(
+    ycocg: Bytes,
+) -> bytearray:
+    one = 1 << FRACTION_BITS
+    center = _fixed(CHROMA_CENTER)
+    matrix = [(one, one, -one), (one, 0, one), (one, -one, -one)]
+    return _transform(ycocg, matrix, [_HALF, _HALF - center, _HALF + 2 * center])
+
+
+def rgb_to_ycocg_r(
+    rgb: Bytes,
+) -> typing.Tuple[bytes, array, array]:
+    """ Lossless YCoCg-R by lifting, as separate Y, Co and Cg planes.
+
+    Y stays in 8 bits, Co and Cg need 9 and are signed 16-bit arrays centered at 0.
+    """
+
+    red, green, blue = _split(rgb)
+    co = array('h', [r - b for r, b in zip(red, blue)])
+    t = [b + (c >> 1) for b, c in zip(blue, co)]
+    cg = array('h', [g - v for g, v in zip(green, t)])
+    y = bytes([v + (c >> 1) for v, c in zip(t, cg)])
+    return y, co, cg
+
+
+def ycocg_r_to_rgb(
+    y: Bytes,
+    co: typing.Sequence[int],
+    cg: typing.Sequence[int],
+) -> bytearray:
+    t = [v - (c >> 1) for v, c in zip(y, cg)]
+    green = bytes([c + v for c, v in zip(cg, t)])
+    blue = [v - (c >> 1) for v, c in zip(t, co)]
+    red = bytes([b + c for b, c in zip(blue, co)])
+    return _join([red, green, bytes(blue)])
+
+
+_FROM_RGB = {
+    ColorFormat.YCbCr601: functools.partial(rgb_to_ycbcr, color_format=ColorFormat.YCbCr601),
+    ColorFormat.YCbCr709: functools.partial(rgb_to_ycbcr, color_format=ColorFormat.YCbCr709),
+    ColorFormat.YCoCg: rgb_to_ycocg,
+}
+_TO_RGB = {
+    ColorFormat.YCbCr601: functools.partial(ycbcr_to_rgb, color_format=ColorFormat.YCbCr601),
+    ColorFormat.YCbCr709: functools.partial(ycbcr_to_rgb, color_format=ColorFormat.YCbCr709),
+    ColorFormat.YCoCg: ycocg_to_rgb,
+}
+INTEGER_FORMATS = (ColorFormat.RGB, *_FROM_RGB)
+
+
+def _check_pnm(
+    pnm_file: PnmFile,
+    *color_formats: ColorFormat,
+):
+    if pnm_file.bytes_per_pixel != 3 or pnm_file.max_color > config.PNM_MAX_COLOR_8_BIT:
+        raise ValueError("Only 8-bit images with three channels can be converted as integers")
+
+    for color_format in color_formats:
+        if color_format not in INTEGER_FORMATS:
+            raise ValueError(f"Unsupported color format: {color_format}")
+
+
+def convert_pnm(
+    pnm_file: PnmFile,
+    convert_from: ColorFormat,
+    convert_to: ColorFormat,
+) -> PnmFile:
+    """ Converts the raw content of an 8-bit color PNM in place, no float buffer is made. """
+
+    _check_pnm(pnm_file, convert_from, convert_to)
+
+    pnm_file.content = _convert(pnm_file.content, convert_from, convert_to)
+    return pnm_file
+
+
+def _convert(
+    content: Bytes,
+    convert_from: ColorFormat,
+    convert_to: ColorFormat,
+) -> Bytes:
+    if convert_from != convert_to:
+        if convert_from != ColorFormat.RGB:
+            content = _TO_RGB[convert_from](content)
+
+        if convert_to != ColorFormat.RGB:
+            content = _FROM_RGB[convert_to](content)
+
+    return content
+
+
+class ChromaSubsampling(enum.Enum):
+    """ Horizontal and vertical factors the chroma planes are reduced by. """
+
+    S444 = (1, 1)
+    S422 = (2, 1)
+    S420 = (2, 2)
+
+
+class ChromaFilter(enum.Enum):
+    # average of the covered pixels, repeated back on upsampling
+    BOX = 0
+    # tent filter with the chroma sited between the pixels, as in JPEG
+    BILINEAR = 1
+
+
+@dataclasses.dataclass
+class YCbCrPlanes:
+    """ 8-bit YCbCr with every channel in its own contiguous plane.
+
+    The filter the chroma was reduced with sets its siting, upsampling uses it too.
+    """
+
+    width: int
+    height: int
+    color_format: ColorFormat
+    subsampling: ChromaSubsampling
+    y: bytes
+    cb: bytes
+    cr: bytes
+    chroma_filter: ChromaFilter = ChromaFilter.BOX
+
+    @property
+    def chroma_width(self) -> int:
+        return -(-self.width // self.subsampling.value[0])
+
+    @property
+    def chroma_height(self) -> int:
+        return -(-self.height // self.subsampling.value[1])
+
+    def to_bytes(self) -> bytes:
+        """ Planes one after another, I420 layout for 4:2:0. """
+
+        return self.y + self.cb + self.cr
+
+    @classmethod
+    def from_bytes(
+        cls,
+        data: Bytes,
+        width: int,
+        height: int,
+        color_format: ColorFormat = ColorFormat.YCbCr601,
+        subsampling: ChromaSubsampling = ChromaSubsampling.S444,
+        chroma_filter: ChromaFilter = ChromaFilter.BOX,
+    ) -> 'YCbCrPlanes':
+        planes = cls(width, height, color_format, subsampling, b'', b'', b'', chroma_filter)
+        luma_size = width * height
+        chroma_size = planes.chroma_width * planes.chroma_height
+        if len(data) != luma_size + 2 * chroma_size:
+            raise ValueError("Wrong planar image size")
+
+        data = bytes(data)
+        planes.y = data[:luma_size]
+        planes.cb = data[luma_size:luma_size + chroma_size]
+        planes.cr = data[luma_size + chroma_size:]
+        return planes
+
+
+def _rows(
+    plane: bytes,
+    width: int,
+) -> typing.List[bytes]:
+    return [plane[i:i + width] for i in range(0, len(plane), width)]
+
+
+def _halve(
+    even: bytes,
+    odd: bytes,
+    before: bytes,
+    after: bytes,
+    chroma_filter: ChromaFilter,
+) -> bytes:
+    """ One sample of every pair, the neighbours of the pair are weighted 1/8 by the tent. """
+
+    if chroma_filter is ChromaFilter.BOX:
+        return bytes([(a + b + 1) >> 1 for a, b in zip(even, odd)])
+
+    return bytes([
+        (p + 3 * (a + b) + n + 4) >> 3 for a, b, p, n in zip(even, odd, before, after)
+    ])
+
+
+def _double(
+    samples: bytes,
+    before: bytes,
+    after: bytes,
+    chroma_filter: ChromaFilter,
+) -> typing.Tuple[bytes, bytes]:
+    """ Two samples of every one, the tent weights the nearer neighbour by 1/4. """
+
+    if chroma_filter is ChromaFilter.BOX:
+        return samples, samples
+
+    return (
+        bytes([(3 * c + p + 2) >> 2 for c, p in zip(samples, before)]),
+        bytes([(3 * c + n + 2) >> 2 for c, n in zip(samples, after)]),
+    )
+
+
+def _downsample_rows(
+    plane: bytes,
+    width: int,
+    chroma_filter: ChromaFilter,
+) -> bytes:
+    rows = _rows(plane, width)
+    if width % 2:
+        rows = [row + row[-1:] for row in rows]
+
+    even = [row[0::2] for row in rows]
+    odd = [row[1::2] for row in rows]
+    before = [e[:1] + o[:-1] for e, o in zip(even, odd)]
+    after = [e[1:] + o[-1:] for e, o in zip(even, odd)]
+    return _halve(*map(b''.join, (even, odd, before, after)), chroma_filter)
+
+
+def _downsample_columns(
+    plane: bytes,
+    width: int,
+    chroma_filter: ChromaFilter,
+) -> bytes:
+    rows = _rows(plane, width)
+    if len(rows) % 2:
+        rows.append(rows[-1])
+
+    even = rows[0::2]
+    odd = rows[1::2]
+    before = even[:1] + odd[:-1]
+    after = even[1:] + odd[-1:]
+    return _halve(*map(b''.join, (even, odd, before, after)), chroma_filter)
+
+
+def _upsample_rows(
+    plane: bytes,
+    width: int,
+    chroma_width: int,
+    chroma_filter: ChromaFilter,
+) -> bytes:
+    rows = _rows(plane, chroma_width)
+    before = b''.join(row[:1] + row[:-1] for row in rows)
+    after = b''.join(row[1:] + row[-1:] for row in rows)
+
+    upsampled = bytearray(len(plane) * 2)
+    upsampled[0::2], upsampled[1::2] = _double(plane, before, after, chroma_filter)
+    if width % 2:
+        return b''.join(row[:width] for row in _rows(upsampled, chroma_width * 2))
+
+    return bytes(upsampled)
+
+
+def _upsample_columns(
+    plane: bytes,
+    width: int,
+    height: int,
+    chroma_filter: ChromaFilter,
+) -> bytes:
+    rows = _rows(plane, width)
+    before = b''.join(rows[:1] + rows[:-1])
+    after = b''.join(rows[1:] + rows[-1:])
+
+    first, second = _double(plane, before, after, chroma_filter)
+    pairs = zip(_rows(first, width), _rows(second, width))
+    return b''.join(itertools.chain.from_iterable(pairs))[:width * height]
+
+
+def to_planar(
+    ycbcr: Bytes,
+    width: int,
+    height: int,
+    color_format: ColorFormat = ColorFormat.YCbCr601,
+    subsampling: ChromaSubsampling = ChromaSubsampling.S444,
+    chroma_filter: ChromaFilter = ChromaFilter.BOX,
+) -> YCbCrPlanes:
+    """ Splits packed 8-bit YCbCr into planes, reducing the chroma ones if asked. """
+
+    if len(ycbcr) != width * height * 3:
+        raise ValueError("Wrong image size")
+
+    y, cb, cr = _split(ycbcr)
+    horizontal, vertical = subsampling.value
+    if horizontal == 2:
+        cb, cr = (_downsample_rows(plane, width, chroma_filter) for plane in (cb, cr))
+
+    if vertical == 2:
+        chroma_width = -(-width // horizontal)
+        cb, cr = (_downsample_columns(plane, chroma_width, chroma_filter) for plane in (cb, cr))
+
+    return YCbCrPlanes(width, height, color_format, subsampling, y, cb, cr, chroma_filter)
+
+
+def from_planar(
+    planes: YCbCrPlanes,
+    chroma_filter: typing.Optional[ChromaFilter] = None,
+) -> bytearray:
+    """ Packed 8-bit YCbCr of planes, reduced chroma ones are upsampled back.
+
+    The chroma is upsampled with the filter of the planes unless another one is given.
+    """
+
+    if chroma_filter is None:
+        chroma_filter = planes.chroma_filter
+
+    cb, cr = planes.cb, planes.cr
+    horizontal, vertical = planes.subsampling.value
+    if vertical == 2:
+        cb, cr = (
+            _upsample_columns(plane, planes.chroma_width, planes.height, chroma_filter)
+            for plane in (cb, cr)
+        )
+
+    if horizontal == 2:
+        cb, cr = (
+            _upsample_rows(plane, planes.width, planes.chroma_width, chroma_filter)
+            for plane in (cb, cr)
+        )
+
+    return _join([planes.y, cb, cr])
+
+
+def pnm_to_planar(
+    pnm_file: PnmFile,
+    convert_from: ColorFormat = ColorFormat.RGB,
+    color_format: ColorFormat = ColorFormat.YCbCr601,
+    subsampling: ChromaSubsampling = ChromaSubsampling.S444,
+    chroma_filter: ChromaFilter = ChromaFilter.BOX,
+) -> YCbCrPlanes:
+    """ Planar YCbCr of an 8-bit color PNM, the output mode for video encoders. """
+
+    _check_pnm(pnm_file, convert_from, color_format)
+    if color_format not in _COEFFICIENTS:
+        raise ValueError(f"Planes can only hold YCbCr, not {color_format}")
+
+    ycbcr = _convert(pnm_file.content, convert_from, color_format)
+    return to_planar(
+        ycbcr, pnm_file.width, pnm_file.height, color_format, subsampling, chroma_filter
+    )
+
+
+def planar_to_pnm(
+    planes: YCbCrPlanes,
+    convert_to: ColorFormat = ColorFormat.RGB,
+    chroma_filter: typing.Optional[ChromaFilter] = None,
+) -> PnmFile:
+    if convert_to not in INTEGER_FORMATS:
+        raise ValueError(f"Unsupported color format: {convert_to}")
+
+    content = _convert(from_planar(planes, chroma_filter), planes.color_format, convert_to)
+    return PnmFile().create(
+        'P6', planes.width, planes.height, config.PNM_MAX_COLOR_8_BIT, 3, bytes(content)
+    )
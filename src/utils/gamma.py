@@ -1,4 +1,7 @@
 import enum
+import functools
+import typing
+from array import array
 
 
 class GammaOption(enum.Enum):
@@ -113,3 +116,39 @@ def resolve_gamma(
         return assign_gamma(px, prev_gamma, next_gamma)
 
     return convert_gamma(px, prev_gamma, next_gamma)
+
+
+@functools.lru_cache(maxsize=32)
+def gamma_lut(
+    prev_gamma: float,
+    next_gamma: float,
+    gamma_option: GammaOption,
+    size: int = 256,
+) -> typing.Union[bytes, array]:
+    """ Corrected value for every one of `size` sample levels, built once per parameters.
+
+    8-bit tables are bytes to be used with `translate`, 16-bit ones are `array('H')`.
+    """
+
+    top = size - 1
+    corrected = (
+        resolve_gamma([i / top], prev_gamma, next_gamma, gamma_option)[0]
+        for i in range(size)
+    )
+    values = (min(top, max(0, int(value * top))) for value in corrected)
+    if size == 256:
+        return bytes(values)
+
+    return array('H', values)
+
+
+def apply_gamma_lut(
+    samples: typing.Union[bytes, bytearray, array],
+    table: typing.Union[bytes, array],
+) -> typing.Union[bytes, bytearray, array]:
+    """ Maps every sample through the table in a single C-level pass. """
+
+    if isinstance(table, bytes):
+        return samples.translate(table)
+
+    return array('H', map(table.__getitem__, samples))
@@ -0,0 +1,197 @@
+import collections
+import dataclasses
+import functools
+import itertools
+import operator
+import sys
+import typing
+from array import array
+
+from src.utils.converter import ColorConverter, ColorFormat
+from src.utils.gamma import GammaOption, resolve_gamma
+
+LATTICE_SIZES = (17, 33)
+# resolved colors an exact table keeps before it starts over
+LUT_MAX_COLORS = 1 << 20
+LUT_CACHE_SIZE = 8
+
+
+@dataclasses.dataclass(frozen=True)
+class LutChain:
+    """ Everything an 8-bit color goes through, the key of a cached table. """
+
+    convert_from: ColorFormat
+    convert_to: ColorFormat
+    prev_gamma: float = 0
+    next_gamma: float = 0
+    gamma_option: GammaOption = GammaOption.ASSIGN
+    disabled_channels: typing.Tuple[bool, bool, bool] = (False, False, False)
+
+    def evaluate(
+        self,
+        channels: typing.Sequence[typing.Sequence[float]],
+    ) -> typing.List[typing.Sequence[float]]:
+        """ Runs the chain over colors given as three channels of values from 0 to 1. """
+
+        size = len(channels[0])
+        channels = [
+            [0.0] * size if disabled else channel
+            for channel, disabled in zip(channels, self.disabled_channels)
+        ]
+        channels = ColorConverter.convert_channels(channels, self.convert_from, self.convert_to)
+        return [
+            resolve_gamma(channel, self.prev_gamma, self.next_gamma, self.gamma_option)
+            for channel in channels
+        ]
+
+
+def _quantize(
+    values: typing.Iterable[float],
+) -> bytes:
+    """ Same rounding as the preview uses to show the floats. """
+
+    values = map(int, map(operator.mul, values, itertools.repeat(255.0)))
+    return bytes(map(max, itertools.repeat(0), map(min, itertools.repeat(255), values)))
+
+
+def _color_keys(
+    rgb: typing.Union[bytes, bytearray, memoryview],
+) -> array:
+    """ Every pixel as a single `r | g << 8 | b << 16` integer.
+
+    Triplets are padded to 4 bytes with slice assignments and read as one array.
+    """
+
+    rgb = bytes(rgb)
+    padded = bytearray(len(rgb) // 3 * 4)
+    for channel in range(3):
+        padded[channel::4] = rgb[channel::3]
+
+    keys = array('I', padded)
+    if sys.byteorder == 'big':
+        keys.byteswap()
+
+    return keys
+
+
+class ColorLut:
+    """ 8-bit color conversion chain baked into a table of resolved colors.
+
+    Pixels are looked up by their 24-bit value, only the colors present in an
+    image are ever resolved. Without a lattice a color goes through the whole
+    chain, with a lattice of 17 or 33 points per axis the chain is evaluated
+    on the lattice once and colors are interpolated trilinearly. Lattices are
+    cheap for heavy chains, but smooth over the hue wrap of HSL and HSV.
+    """
+
+    def __init__(
+        self,
+        chain: LutChain,
+        lattice_size: typing.Optional[int] = None,
+    ):
+        if lattice_size is not None and lattice_size not in LATTICE_SIZES:
+            raise ValueError(f"Unsupported lattice size: {lattice_size}")
+
+        self.chain = chain
+        self.lattice_size = lattice_size
+        self.__lattice = None if lattice_size is None else self.__build_lattice(lattice_size)
+        self.__colors: typing.Dict[int, bytes] = {}
+
+    def __len__(self):
+        return len(self.__colors)
+
+    def apply(
+        self,
+        rgb: typing.Union[bytes, bytearray, memoryview],
+    ) -> bytes:
+        """ Converts packed 8-bit triplets, every pixel costs a single dict lookup. """
+
+        keys = _color_keys(rgb)
+        colors = self.__colors
+        unique = set(keys)
+        missing = unique.difference(colors)
+        if len(colors) + len(missing) > LUT_MAX_COLORS:
+            if len(unique) > LUT_MAX_COLORS:
+                # the image alone has more colors than the table keeps, its new ones are
+                # resolved aside and the table stays as it is
+                colors = collections.ChainMap({}, colors)
+            else:
+                colors.clear()
+                missing = unique
+
+        if missing:
+            colors.update(self.__resolve(list(missing)))
+
+        return b''.join(map(colors.__getitem__, keys))
+
+    def __resolve(
+        self,
+        keys: typing.List[int],
+    ) -> typing.Dict[int, bytes]:
+        channels = [
+            list(map(operator.and_, map(operator.rshift, keys, itertools.repeat(shift)),
+                     itertools.repeat(255)))
+            for shift in (0, 8, 16)
+        ]
+        if self.__lattice is None:
+            scaled = [list(map(operator.truediv, c, itertools.repeat(255.0))) for c in channels]
+            converted = self.chain.evaluate(scaled)
+        else:
+            converted = self.__interpolate(channels)
+
+        quantized = [_quantize(channel) for channel in converted]
+        return dict(zip(keys, map(bytes, zip(*quantized))))
+
+    def __build_lattice(
+        self,
+        size: int,
+    ) -> typing.List[typing.Sequence[float]]:
+        steps = [i / (size - 1) for i in range(size)]
+        points = list(itertools.product(steps, repeat=3))
+        return self.chain.evaluate([[point[i] for point in points] for i in range(3)])
+
+    def __interpolate(
+        self,
+        channels: typing.List[typing.List[int]],
+    ) -> typing.List[typing.List[float]]:
+        """ Trilinear interpolation between the 8 lattice points around every color. """
+
+        size = self.lattice_size
+        positions = [
+            list(map(operator.truediv, map(operator.mul, channel, itertools.repeat(size - 1)),
+                     itertools.repeat(255)))
+            for channel in channels
+        ]
+        # the upper corner stays inside the lattice, for 255 the lower one gets weight 0
+        lower = [list(map(min, map(int, p), itertools.repeat(size - 2))) for p in positions]
+        weights = [list(map(operator.sub, p, low)) for p, low in zip(positions, lower)]
+
+        strides = (size * size, size, 1)
+        base = [0] * len(channels[0])
+        for low, stride in zip(lower, strides):
+            base = list(map(operator.add, base, map(operator.mul, low, itertools.repeat(stride))))
+
+        converted = [[0.0] * len(base) for _ in range(3)]
+        for corner in itertools.product((0, 1), repeat=3):
+            offset = sum(stride for stride, bit in zip(strides, corner) if bit)
+            weight = [1.0] * len(base)
+            for bit, w in zip(corner, weights):
+                axis = w if bit else map(operator.sub, itertools.repeat(1.0), w)
+                weight = list(map(operator.mul, weight, axis))
+
+            indices = list(map(operator.add, base, itertools.repeat(offset)))
+            for out, lattice in zip(converted, self.__lattice):
+                values = map(operator.mul, map(lattice.__getitem__, indices), weight)
+                out[:] = map(operator.add, out, values)
+
+        return converted
+
+
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def get_color_lut(
+    chain: LutChain,
+    lattice_size: typing.Optional[int] = None,
+) -> ColorLut:
+    """ Table of the chain, the least recently used ones are dropped past the cache size. """
+
+    return ColorLut(chain, lattice_size)
@@ -1,12 +1,643 @@
+import collections
+import enum
+import itertools
+import operator
+import struct
+import sys
 import typing
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from src.errors.png import PngError
+
+FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVERAGE, FILTER_PAETH = 0, 1, 2, 3, 4
+FILTER_ADAPTIVE = -1
+FILTER_TYPES = (FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVERAGE, FILTER_PAETH)
+INFLATE_MAX_LENGTH = 1 << 16
+IDAT_CHUNK_SIZE = 1 << 16
+MAX_CHUNK_SIZE = (1 << 31) - 1
+PARALLEL_BLOCK_SIZE = 1 << 17
+DEFLATE_WINDOW_SIZE = 1 << 15
+ADLER_BASE = 65521
+COMPRESSION_STRATEGIES = (
+    zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED, zlib.Z_HUFFMAN_ONLY, zlib.Z_RLE, zlib.Z_FIXED,
+)
+
+
+class CompressionProfile(enum.Enum):
+    DEFAULT = 0
+    FAST = 1
+    MAX = 2
+
+
+# compression level, strategy and filter type of every profile
+COMPRESSION_PROFILES = {
+    CompressionProfile.DEFAULT: (zlib.Z_DEFAULT_COMPRESSION, zlib.Z_DEFAULT_STRATEGY, FILTER_SUB),
+    CompressionProfile.FAST: (1, zlib.Z_RLE, FILTER_SUB),
+    CompressionProfile.MAX: (9, zlib.Z_FILTERED, FILTER_ADAPTIVE),
+}
+
+_low_byte = (255).__and__
+# distance of a filtered byte from zero when it is read as a signed value
+_SIGNED_ABS = bytes(min(i, 256 - i) for i in range(256))
+# samples packed in every byte value for 1, 2 and 4 bit depths, the leftmost goes first
+_UNPACKED_SAMPLES = {
+    depth: [
+        bytes((value << shift & 255) >> (8 - depth) for shift in range(0, 8, depth))
+        for value in range(256)
+    ]
+    for depth in (1, 2, 4)
+}
+# sub-byte sample values stretched to the whole 0..255 range
+_SCALED_SAMPLES = {
+    depth: bytes(min(255, value * 255 // ((1 << depth) - 1)) for value in range(256))
+    for depth in (1, 2, 4)
+}
+_OPAQUE = bytes((0, 255)) + bytes(254)
+# Paeth predictor minus the upper left byte, indexed by the left and the upper byte
+# minus the upper left one, both shifted from -255..255 to 0..510
+_PAETH_OFFSETS = bytes(
+    (da if abs(db) <= abs(da) and abs(db) <= abs(da + db) else db if abs(da) <= abs(da + db) else 0)
+    & 255
+    for da in range(-255, 256)
+    for db in range(-255, 256)
+)
+_PAETH_CENTER = 255 * 511 + 255
+# sample values moved to the given bit offset inside a byte
+_SHIFTED_SAMPLES = [bytes((value << shift) & 255 for value in range(256)) for shift in range(8)]
+
+# first column, first row, column step and row step of every Adam7 pass
+ADAM7_PASSES = (
+    (0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4),
+    (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2),
+)
+# area each pixel of a pass stands for until the next passes are decoded
+ADAM7_BLOCKS = ((8, 8), (4, 8), (4, 4), (2, 4), (2, 2), (1, 2), (1, 1))
 
 
 def get_chunk_length(
-    bts: typing.List[int],
+    bts: typing.Union[bytes, typing.Sequence[int]],
+) -> int:
+    return int.from_bytes(bytes(bts), 'big')
+
+
+def unfilter_scanline(
+    filter_type: int,
+    scanline: typing.Union[bytes, bytearray, memoryview],
+    prev: typing.Optional[bytearray],
+    bpp: int,
+) -> bytearray:
+    """ Reconstructs one scanline against the previous reconstructed one.
+
+    `prev` is None for the first scanline of the image, it is treated as zeros.
+    """
+
+    if filter_type == FILTER_NONE:
+        return bytearray(scanline)
+
+    if filter_type == FILTER_SUB or (filter_type == FILTER_PAETH and prev is None):
+        # with the upper row being zeros Paeth always picks the left byte
+        row = bytearray(len(scanline))
+        for k in range(bpp):
+            row[k::bpp] = bytes(map(_low_byte, itertools.accumulate(scanline[k::bpp])))
+
+        return row
+
+    if filter_type == FILTER_UP:
+        if prev is None:
+            return bytearray(scanline)
+
+        return bytearray(map(_low_byte, map(operator.add, scanline, prev)))
+
+    if filter_type == FILTER_AVERAGE:
+        return _unfilter_average(scanline, prev, bpp)
+
+    if filter_type == FILTER_PAETH:
+        return _unfilter_paeth(scanline, prev, bpp)
+
+    raise PngError(f'Invalid filter type: {filter_type}')
+
+
+def _unfilter_average(
+    scanline: typing.Union[bytes, bytearray, memoryview],
+    prev: typing.Optional[bytearray],
+    bpp: int,
+) -> bytearray:
+    row = bytearray(scanline)
+    if prev is None:
+        for i in range(bpp, len(row)):
+            row[i] = (row[i] + (row[i - bpp] >> 1)) & 255
+
+        return row
+
+    for i in range(min(bpp, len(row))):
+        row[i] = (row[i] + (prev[i] >> 1)) & 255
+
+    for i in range(bpp, len(row)):
+        row[i] = (row[i] + ((row[i - bpp] + prev[i]) >> 1)) & 255
+
+    return row
+
+
+def _unfilter_paeth(
+    scanline: typing.Union[bytes, bytearray, memoryview],
+    prev: bytearray,
+    bpp: int,
+) -> bytearray:
+    row = bytearray(scanline)
+    for i in range(min(bpp, len(row))):
+        row[i] = (row[i] + prev[i]) & 255
+
+    for i in range(bpp, len(row)):
+        a, b, c = row[i - bpp], prev[i], prev[i - bpp]
+        pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - c - c)
+        if pa <= pb and pa <= pc:
+            row[i] = (row[i] + a) & 255
+        elif pb <= pc:
+            row[i] = (row[i] + b) & 255
+        else:
+            row[i] = (row[i] + c) & 255
+
+    return row
+
+
+def inflate(
+    chunks: typing.Iterable[typing.Union[bytes, bytearray, memoryview]],
+    max_length: int = INFLATE_MAX_LENGTH,
+) -> typing.Iterator[bytes]:
+    """ Decompresses a zlib stream split into chunks, output goes by `max_length` pieces. """
+
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        data = chunk
+        while data:
+            piece = decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+            if piece:
+                yield piece
+
+    piece = decompressor.flush()
+    if piece:
+        yield piece
+
+
+def iter_scanlines(
+    chunks: typing.Iterable[typing.Union[bytes, bytearray, memoryview]],
+    row_size: int,
+    height: int,
+    bpp: int,
+) -> typing.Iterator[bytearray]:
+    """ Yields reconstructed scanlines as soon as enough IDAT data is decompressed.
+
+    Only a few scanlines and the zlib window are kept in memory at once.
+    """
+
+    for _, row in iter_pass_scanlines(chunks, [(row_size, height)], bpp):
+        yield row
+
+
+def iter_pass_scanlines(
+    chunks: typing.Iterable[typing.Union[bytes, bytearray, memoryview]],
+    images: typing.Sequence[typing.Tuple[int, int]],
+    bpp: int,
+) -> typing.Iterator[typing.Tuple[int, bytearray]]:
+    """ Same as `iter_scanlines` for several sub-images stored one after another.
+
+    `images` are (row size, height) pairs, like the Adam7 passes, filtering
+    starts over with every one of them. Empty sub-images take no data at all.
+    Yields index of the sub-image and the reconstructed scanline.
+    """
+
+    passes = iter([
+        (index, row_size, height)
+        for index, (row_size, height) in enumerate(images)
+        if row_size and height
+    ])
+    current = next(passes, None)
+    max_stride = max((row_size + 1 for row_size, _ in images), default=1)
+    pending, prev, y = bytearray(), None, 0
+    for piece in inflate(chunks, max(max_stride, INFLATE_MAX_LENGTH)):
+        pending += piece
+        offset = 0
+        while current is not None:
+            index, row_size, height = current
+            stride = row_size + 1
+            if len(pending) - offset < stride:
+                break
+
+            prev = unfilter_scanline(
+                pending[offset], pending[offset + 1:offset + stride], prev, bpp
+            )
+            offset += stride
+            y += 1
+            yield index, prev
+
+            if y == height:
+                current, prev, y = next(passes, None), None, 0
+
+        del pending[:offset]
+
+    if current is not None:
+        raise PngError('Not enough image data')
+
+
+def unfilter(
+    data: typing.Union[bytes, bytearray, memoryview],
+    row_size: int,
+    height: int,
+    bpp: int,
+) -> bytearray:
+    """ Reconstructs all the scanlines into a single contiguous pixel buffer.
+
+    Every scanline in `data` starts with its filter type byte, only the current
+    and the previous reconstructed rows are kept besides the result.
+    """
+
+    if len(data) < (row_size + 1) * height:
+        raise PngError('Not enough image data')
+
+    pixels, prev = bytearray(row_size * height), None
+    data = memoryview(data)
+    for y in range(height):
+        begin = y * (row_size + 1)
+        prev = unfilter_scanline(data[begin], data[begin + 1:begin + 1 + row_size], prev, bpp)
+        pixels[y * row_size:(y + 1) * row_size] = prev
+
+    return pixels
+
+
+def filter_scanline(
+    filter_type: int,
+    scanline: typing.Union[bytes, bytearray],
+    prev: typing.Optional[typing.Union[bytes, bytearray]],
+    bpp: int,
+) -> bytes:
+    """ Applies one of the PNG filters to a raw scanline, `prev` is None for the first one. """
+
+    if filter_type == FILTER_NONE:
+        return bytes(scanline)
+
+    left = bytes(bpp) + scanline[:-bpp]
+    if prev is None:
+        prev = bytes(len(scanline))
+
+    # one comprehension per filter, it is cheaper than chaining `map` over `operator` calls
+    if filter_type == FILTER_SUB:
+        return bytes([(x - a) & 255 for x, a in zip(scanline, left)])
+
+    if filter_type == FILTER_UP:
+        return bytes([(x - b) & 255 for x, b in zip(scanline, prev)])
+
+    if filter_type == FILTER_AVERAGE:
+        return bytes([(x - ((a + b) >> 1)) & 255 for x, a, b in zip(scanline, left, prev)])
+
+    if filter_type == FILTER_PAETH:
+        up_left = bytes(bpp) + prev[:-bpp]
+        return bytes([
+            (x - c - _PAETH_OFFSETS[(a - c) * 511 + b - c + _PAETH_CENTER]) & 255
+            for x, a, b, c in zip(scanline, left, prev, up_left)
+        ])
+
+    raise PngError(f'Invalid filter type: {filter_type}')
+
+
+def choose_filter(
+    scanline: typing.Union[bytes, bytearray],
+    prev: typing.Optional[typing.Union[bytes, bytearray]],
+    bpp: int,
+) -> typing.Tuple[int, bytes]:
+    """ Picks the filter with the minimum sum of absolute differences for the scanline. """
+
+    return min(
+        (
+            (filter_type, filter_scanline(filter_type, scanline, prev, bpp))
+            for filter_type in FILTER_TYPES
+        ),
+        key=lambda filtered: sum(filtered[1].translate(_SIGNED_ABS)),
+    )
+
+
+def iter_filtered_scanlines(
+    scanlines: typing.Iterable[typing.Union[bytes, bytearray]],
+    bpp: int,
+    filter_type: int = FILTER_ADAPTIVE,
+) -> typing.Iterator[bytes]:
+    """ Yields every scanline filtered and prefixed with its filter type byte. """
+
+    prev = None
+    for scanline in scanlines:
+        if filter_type == FILTER_ADAPTIVE:
+            chosen_type, line = choose_filter(scanline, prev, bpp)
+        else:
+            chosen_type, line = filter_type, filter_scanline(filter_type, scanline, prev, bpp)
+
+        yield bytes((chosen_type,)) + line
+        prev = scanline
+
+
+def filter_scanlines(
+    scanlines: typing.Iterable[typing.Union[bytes, bytearray]],
+    bpp: int,
+    filter_type: int = FILTER_ADAPTIVE,
+) -> bytes:
+    return b''.join(iter_filtered_scanlines(scanlines, bpp, filter_type))
+
+
+def deflate(
+    chunks: typing.Iterable[bytes],
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: int = zlib.Z_DEFAULT_STRATEGY,
+) -> typing.Iterator[bytes]:
+    """ Compresses the chunks into a single zlib stream while they are produced. """
+
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED, zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy
+    )
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def parallel_deflate(
+    chunks: typing.Iterable[bytes],
+    level: int = zlib.Z_DEFAULT_COMPRESSION,
+    strategy: int = zlib.Z_DEFAULT_STRATEGY,
+    workers: int = 2,
+    block_size: int = PARALLEL_BLOCK_SIZE,
+) -> typing.Iterator[bytes]:
+    """ Compresses the chunks into a single zlib stream on a thread pool, like pigz does.
+
+    The input is split into blocks deflated independently, zlib releases the GIL
+    while it works. Every block is primed with the last 32 KiB of the previous
+    one and ends with a sync flush, so the raw deflate outputs can be simply
+    concatenated. The Adler-32 of the whole input is combined from the blocks.
+    """
+
+    yield _zlib_header(level)
+
+    adler, dictionary, in_flight = 1, b'', collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for block, last in _iter_blocks(chunks, block_size):
+            in_flight.append(pool.submit(
+                _deflate_block, block, dictionary, level, strategy, last
+            ))
+            dictionary = block[-DEFLATE_WINDOW_SIZE:]
+            while in_flight and (last or len(in_flight) > 2 * workers):
+                compressed, block_adler, block_length = in_flight.popleft().result()
+                adler = adler32_combine(adler, block_adler, block_length)
+                yield compressed
+
+    yield struct.pack('>I', adler)
+
+
+def _iter_blocks(
+    chunks: typing.Iterable[bytes],
+    block_size: int,
+) -> typing.Iterator[typing.Tuple[bytes, bool]]:
+    pending, block = bytearray(), None
+    for chunk in chunks:
+        pending += chunk
+        while len(pending) >= block_size:
+            if block is not None:
+                yield block, False
+
+            block = bytes(pending[:block_size])
+            del pending[:block_size]
+
+    if pending or block is None:
+        if block is not None:
+            yield block, False
+
+        block = bytes(pending)
+
+    yield block, True
+
+
+def _deflate_block(
+    block: bytes,
+    dictionary: bytes,
+    level: int,
+    strategy: int,
+    last: bool,
+) -> typing.Tuple[bytes, int, int]:
+    options = {'zdict': dictionary} if dictionary else {}
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED, -zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL, strategy, **options
+    )
+    compressed = compressor.compress(block) + compressor.flush(
+        zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+    )
+    return compressed, zlib.adler32(block), len(block)
+
+
+def _zlib_header(
+    level: int,
+) -> bytes:
+    # FLEVEL is informational only: fastest, fast, default, maximum
+    if level == zlib.Z_DEFAULT_COMPRESSION or level == 6:
+        flevel = 2
+    elif level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    else:
+        flevel = 3
+
+    cmf, flg = 0x78, flevel << 6
+    flg += 31 - (cmf * 256 + flg) % 31
+    return bytes((cmf, flg))
+
+
+def adler32_combine(
+    adler1: int,
+    adler2: int,
+    length2: int,
 ) -> int:
-    length, power = 0, 0
-    for x in reversed(bts):
-        length += int(hex(x)[2:], 16) * (256 ** power)
-        power += 1
+    """ Adler-32 of two concatenated buffers from their checksums, as zlib does it. """
+
+    remainder = length2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = remainder * sum1 % ADLER_BASE
+    sum1 += (adler2 & 0xffff) + ADLER_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - remainder
+    return sum1 % ADLER_BASE | (sum2 % ADLER_BASE) << 16
+
+
+def unpack_samples(
+    pixels: bytearray,
+    bit_depth: int,
+    samples_per_row: int,
+    row_size: int,
+) -> typing.Union[bytearray, array]:
+    """ Splits unfiltered scanlines into one sample per item.
+
+    Sub-byte samples become bytes through a per-byte table, padding bits at the
+    end of every row are dropped. 16-bit samples become `array('H')`.
+    """
+
+    if bit_depth == 8:
+        return pixels
+
+    if bit_depth == 16:
+        samples = array('H', bytes(pixels))
+        if sys.byteorder == 'little':
+            samples.byteswap()
+
+        return samples
+
+    table = _UNPACKED_SAMPLES[bit_depth]
+    samples = bytearray()
+    for begin in range(0, len(pixels), row_size):
+        row = pixels[begin:begin + row_size]
+        samples += b''.join(map(table.__getitem__, row))[:samples_per_row]
+
+    return samples
+
+
+def pack_samples(
+    samples: typing.Union[bytearray, array],
+    bit_depth: int,
+    samples_per_row: int,
+) -> bytearray:
+    """ Reverse of `unpack_samples`, every row is padded to whole bytes. """
+
+    if bit_depth == 8:
+        return bytearray(samples)
+
+    if bit_depth == 16:
+        samples = array('H', samples)
+        if sys.byteorder == 'little':
+            samples.byteswap()
+
+        return bytearray(samples.tobytes())
+
+    per_byte = 8 // bit_depth
+    packed = bytearray()
+    for begin in range(0, len(samples), samples_per_row):
+        row = samples[begin:begin + samples_per_row]
+        row += bytes(-len(row) % per_byte)
+        values = bytes(len(row) // per_byte)
+        for k in range(per_byte):
+            shifted = row[k::per_byte].translate(_SHIFTED_SAMPLES[8 - bit_depth * (k + 1)])
+            values = map(operator.or_, values, shifted)
+
+        packed += bytes(values)
+
+    return packed
+
+
+def adam7_pass_sizes(
+    width: int,
+    height: int,
+) -> typing.List[typing.Tuple[int, int]]:
+    return [
+        ((width - x0 + dx - 1) // dx, (height - y0 + dy - 1) // dy)
+        for x0, y0, dx, dy in ADAM7_PASSES
+    ]
+
+
+def scatter_pass_row(
+    samples: typing.Union[bytearray, array],
+    row: typing.Union[bytearray, array],
+    y: int,
+    width: int,
+    height: int,
+    channels: int,
+    pass_index: int,
+    block: typing.Tuple[int, int] = (1, 1),
+):
+    """ Puts the pixels of an Adam7 pass row to their places in the whole image.
+
+    With a `block` larger than a pixel every one of them is also repeated right
+    and down over the area not decoded yet, which gives a coarse preview.
+    """
+
+    x0, _, dx, _ = ADAM7_PASSES[pass_index]
+    block_width, block_height = block
+    row_size = width * channels
+    begin = y * row_size
+    for x in range(x0, min(x0 + block_width, width)):
+        count = (width - x + dx - 1) // dx
+        for channel in range(channels):
+            samples[begin + x * channels + channel:begin + row_size:dx * channels] = (
+                row[channel::channels][:count]
+            )
+
+    for below in range(y + 1, min(y + block_height, height)):
+        samples[below * row_size:(below + 1) * row_size] = samples[begin:begin + row_size]
+
+
+def gather_passes(
+    samples: typing.Union[bytearray, array],
+    width: int,
+    height: int,
+    channels: int,
+) -> typing.Iterator[typing.List[typing.Union[bytearray, array]]]:
+    """ Splits unpacked samples into rows of the Adam7 passes, empty passes are skipped. """
+
+    row_size = width * channels
+    sizes = adam7_pass_sizes(width, height)
+    for (x0, y0, dx, dy), (pass_width, pass_height) in zip(ADAM7_PASSES, sizes):
+        if not pass_width or not pass_height:
+            continue
+
+        rows = []
+        for y in range(y0, height, dy):
+            row = samples[y * row_size:(y + 1) * row_size]
+            # same container type as the samples, every item is overwritten below
+            pass_row = row[:1] * (pass_width * channels)
+            for channel in range(channels):
+                pass_row[channel::channels] = row[x0 * channels + channel::dx * channels]
+
+            rows.append(pass_row)
+
+        yield rows
+
+
+def to_8bit_samples(
+    samples: typing.Union[bytearray, array],
+    bit_depth: int,
+) -> bytearray:
+    """ Scales unpacked samples of any bit depth to 8 bits. """
+
+    if bit_depth == 8:
+        return samples
+
+    if bit_depth == 16:
+        return bytearray(map((8).__rrshift__, samples))
+
+    return samples.translate(_SCALED_SAMPLES[bit_depth])
+
+
+def transparency_mask(
+    values: typing.Iterable,
+    transparent: typing.Any,
+) -> bytearray:
+    """ Alpha channel with 0 where the value equals the tRNS one and 255 elsewhere. """
+
+    return bytearray(map(transparent.__ne__, values)).translate(_OPAQUE)
+
+
+def expand_palette(
+    indices: bytearray,
+    palette: bytes,
+    transparency: typing.Optional[bytes] = None,
+) -> typing.Tuple[bytearray, typing.Optional[bytearray]]:
+    """ Looks palette indices up with one translate per channel. """
+
+    if len(palette) % 3 != 0 or not 0 < len(palette) <= 768:
+        raise PngError('Invalid PLTE chunk length')
+
+    rgb = bytearray(len(indices) * 3)
+    for channel in range(3):
+        rgb[channel::3] = indices.translate(palette[channel::3].ljust(256, b'\x00'))
+
+    alpha = None
+    if transparency is not None:
+        alpha = indices.translate(transparency[:256].ljust(256, b'\xff'))
 
-    return length
+    return rgb, alpha
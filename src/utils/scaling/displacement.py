@@ -1,3 +1,5 @@
+from array import array
+
 from src.entities.pnm import PnmFileUI
 
 
@@ -9,18 +11,20 @@ def displace(
     if x == 0 and y == 0:
         return
 
-    new_content = [0.0] * len(img.content)
+    new_content = array('f', bytes(len(img.content) * img.content.itemsize))
+    row_size = img.width * img.bytes_per_px
+    begin_col, end_col = max(0, -x), min(img.width, img.width - x)
+    if begin_col >= end_col:
+        img.content = new_content
+        return
+
     for row_idx in range(img.height):
         if row_idx + y < 0 or row_idx + y >= img.height:
             continue
 
-        for col_idx in range(img.width):
-            if col_idx + x < 0 or col_idx + x >= img.width:
-                continue
-
-            begin = (col_idx + row_idx * img.width) * img.bytes_per_px
-            new_begin = ((col_idx + x) + (row_idx + y) * img.width) * img.bytes_per_px
-            new_content[new_begin: new_begin + img.bytes_per_px] = img.content[
-                                                                   begin: begin + img.bytes_per_px]
+        begin = row_idx * row_size + begin_col * img.bytes_per_px
+        end = row_idx * row_size + end_col * img.bytes_per_px
+        new_begin = (row_idx + y) * row_size + (begin_col + x) * img.bytes_per_px
+        new_content[new_begin: new_begin + end - begin] = img.content[begin: end]
 
     img.content = new_content
@@ -38,6 +38,7 @@ def lanczos_scaling(
         max_color=img.max_color,
         bytes_per_px=img.bytes_per_px,
         content=new_content,
+        tuple_type=img.tuple_type,
     )
 
 
@@ -22,4 +22,5 @@ def nearest_point_scaling(
         max_color=img.max_color,
         bytes_per_px=img.bytes_per_px,
         content=new_content,
+        tuple_type=img.tuple_type,
     )
@@ -17,13 +17,13 @@ def validate_max_color(
 ) -> int:
     try:
         max_color_value = int(max_color_value)
-    except ValueError:
+    except (TypeError, ValueError):
         raise PnmColorError('Invalid max color value "%s"' % max_color_value)
 
-    if max_color_value > 255:
+    if max_color_value > config.PNM_MAX_COLOR:
         raise PnmColorError('Max color value "%s" is too big' % max_color_value)
 
-    if max_color_value < 0:
+    if max_color_value < 1:
         raise PnmColorError('Max color value "%s" is too small' % max_color_value)
 
     return max_color_value
@@ -56,6 +56,15 @@ def validate_pnm_format(
     return pnm_format
 
 
+def validate_tuple_type(
+    tuple_type: typing.Optional[str],
+) -> int:
+    if tuple_type not in config.PAM_TUPLE_TYPES:
+        raise PnmFormatError('Unsupported tuple type "%s"' % tuple_type)
+
+    return config.PAM_TUPLE_TYPES[tuple_type]
+
+
 def validate_file(
     file: typing.BinaryIO,
 ):
@@ -64,13 +73,18 @@ def validate_file(
 
 
 def validate_image_content(
-    image_content: typing.List[int],
+    image_content: typing.Sized,
     width: int,
     height: int,
     pnm_format: str,
+    tuple_type: typing.Optional[str] = None,
 ):
-    validate_pnm_format(pnm_format)
-    bytes_per_pixel = config.PNM_BYTES_PER_PIXEL[pnm_format]
+    validate_pnm_format(pnm_format, config.PNM_WRITABLE_FORMATS)
+    if pnm_format == config.P7:
+        bytes_per_pixel = validate_tuple_type(tuple_type)
+    else:
+        bytes_per_pixel = config.PNM_BYTES_PER_PIXEL[pnm_format]
+
     if len(image_content) // width != bytes_per_pixel * height:
         raise PnmSizeError('Invalid image content size')
 
@@ -71,7 +71,7 @@ def pnm_file_content_size_too_much(file):
 @pytest.fixture
 def pnm_file_wrong_format(file):
     with open(file.name, 'wb') as f:
-        f.write(b'P4\n2 2\n255\n\x00')
+        f.write(b'P9\n2 2\n255\n\x00')
 
     yield file.name
 
@@ -79,6 +79,6 @@ def pnm_file_wrong_format(file):
 @pytest.fixture
 def pnm_file_wrong_max_color_value(file):
     with open(file.name, 'wb') as f:
-        f.write(b'P5\n2 2\n256\n\x00')
+        f.write(b'P5\n2 2\n65536\n\x00')
 
     yield file.name
@@ -0,0 +1,73 @@
+import random
+from array import array
+
+import pytest
+
+from src.entities.pnm import PnmFileUI
+from src.utils.converter import ColorConverter, ColorFormat
+
+# primaries, grays and random colors, so every hue sector is hit
+PIXELS = [
+    0, 0, 0, 1, 1, 1, 0.5, 0.5, 0.5, 1, 0, 0, 0, 1, 0, 0, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0, 1,
+    *(random.Random(0).random() for _ in range(300)),
+]
+
+
+def convert_by_pixel(content, convert_from, convert_to):
+    converter = ColorConverter(convert_to)
+    return [
+        value
+        for i in range(0, len(content), 3)
+        for value in converter.convert_px(convert_from, list(content[i:i + 3]))
+    ]
+
+
+@pytest.mark.parametrize('convert_from', list(ColorFormat))
+@pytest.mark.parametrize('convert_to', list(ColorFormat))
+def test_convert_image(convert_from, convert_to):
+    content = array('f', PIXELS)
+    expected = array('f', convert_by_pixel(content, convert_from, convert_to))
+
+    converted = ColorConverter.convert_image(content, convert_from, convert_to)
+
+    assert converted.typecode == 'f'
+    assert converted.tolist() == pytest.approx(expected.tolist(), abs=1e-6)
+
+
+def test_convert_image_keeps_alpha():
+    content = array('f', [0.2, 0.4, 0.6, 0.9, 1, 0, 0, 0.1])
+    converted = ColorConverter.convert_image(content, ColorFormat.RGB, ColorFormat.CMY, 4)
+
+    assert converted.tolist() == pytest.approx([0.8, 0.6, 0.4, 0.9, 0, 1, 1, 0.1])
+
+
+@pytest.mark.parametrize('bytes_per_px', [1, 3])
+def test_rgb_channels_of_image(bytes_per_px):
+    image = PnmFileUI('P6', 2, 1, 255, bytes_per_px, [i / 6 for i in range(2 * bytes_per_px)])
+    disabled_channels = [False, True, False]
+
+    channels = image.get_rgb_channels(disabled_channels)
+    for x in range(2):
+        px = image.get_px(x * bytes_per_px, disabled_channels)
+        assert [channel[x] for channel in channels] == list(px)
+
+    image.set_color_channels([[1, 1], [0, 0], [0, 0]])
+    assert image.get_px(0)[0] == 1
+
+
+@pytest.mark.parametrize('convert_from', ColorConverter.AFFINE_FORMATS)
+@pytest.mark.parametrize('convert_to', ColorConverter.AFFINE_FORMATS)
+def test_affine_transform(convert_from, convert_to):
+    transform = ColorConverter.get_affine_transform(convert_from, convert_to)
+    assert ColorConverter.get_affine_transform(convert_from, convert_to) is transform
+
+    round_trip = transform.then(ColorConverter.get_affine_transform(convert_to, convert_from))
+    for i in range(3):
+        assert round_trip.matrix[i] == pytest.approx([float(i == j) for j in range(3)])
+        assert round_trip.offset[i] == 0
+
+
+def test_affine_transform_skips_zero_terms():
+    transform = ColorConverter.get_affine_transform(ColorFormat.RGB, ColorFormat.CMY)
+    assert transform.matrix == [[-1, 0, 0], [0, -1, 0], [0, 0, -1]]
+    assert transform.offset == [1, 1, 1]
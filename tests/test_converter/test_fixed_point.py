@@ -0,0 +1,266 @@
+import functools
+import itertools
+import math
+import random
+
+import pytest
+
+from src.entities.pnm import PnmFile
+from src.utils import fixed_point
+from src.utils.converter import ColorConverter, ColorFormat
+
+RGB = random.Random(0).randbytes(3 * 5000) + bytes([0, 0, 0, 255, 255, 255, 255, 0, 0, 0, 0, 255])
+COEFFICIENTS = {
+    ColorFormat.YCbCr601: (0.299, 0.114),
+    ColorFormat.YCbCr709: (0.2126, 0.0722),
+}
+
+
+def round_byte(value):
+    return max(0, min(255, math.floor(value + 0.5)))
+
+
+def max_difference(a, b):
+    assert len(a) == len(b)
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def ycbcr_by_pixel(rgb, color_format):
+    kr, kb = COEFFICIENTS[color_format]
+    converted = bytearray()
+    for i in range(0, len(rgb), 3):
+        r, g, b = rgb[i:i + 3]
+        y = kr * r + (1 - kr - kb) * g + kb * b
+        converted += bytes([
+            round_byte(y),
+            round_byte((b - y) / (2 * (1 - kb)) + 128),
+            round_byte((r - y) / (2 * (1 - kr)) + 128),
+        ])
+
+    return converted
+
+
+@pytest.mark.parametrize('color_format', list(COEFFICIENTS))
+def test_ycbcr(color_format):
+    ycbcr = fixed_point.rgb_to_ycbcr(RGB, color_format)
+    assert max_difference(ycbcr, ycbcr_by_pixel(RGB, color_format)) <= 1
+    assert ycbcr[-12:] == ycbcr_by_pixel(RGB[-12:], color_format)
+    assert max_difference(fixed_point.ycbcr_to_rgb(ycbcr, color_format), RGB) <= 1
+
+
+def test_ycocg():
+    ycocg = fixed_point.rgb_to_ycocg(RGB)
+    for i in range(0, len(RGB), 3):
+        r, g, b = RGB[i:i + 3]
+        assert ycocg[i:i + 3] == bytes([
+            round_byte(r / 4 + g / 2 + b / 4),
+            round_byte(r / 2 - b / 2 + 128),
+            round_byte(-r / 4 + g / 2 - b / 4 + 128),
+        ])
+
+    assert max_difference(fixed_point.ycocg_to_rgb(ycocg), RGB) <= 1
+
+
+@pytest.mark.parametrize(
+    'convert_from, convert_to',
+    [
+        (fixed_point.rgb_to_ycbcr, fixed_point.ycbcr_to_rgb),
+        (functools.partial(fixed_point.rgb_to_ycbcr, color_format=ColorFormat.YCbCr709),
+         functools.partial(fixed_point.ycbcr_to_rgb, color_format=ColorFormat.YCbCr709)),
+        (fixed_point.rgb_to_ycocg, fixed_point.ycocg_to_rgb),
+    ],
+)
+def test_grays_round_trip(convert_from, convert_to):
+    grays = bytes(itertools.chain.from_iterable((v, v, v) for v in range(256)))
+    converted = convert_from(grays)
+    assert converted[0::3] == bytes(range(256))
+    assert set(converted[1::3]) == set(converted[2::3]) == {128}
+    assert convert_to(converted) == grays
+
+
+def test_ycocg_r_is_lossless():
+    rgb = bytes(itertools.chain.from_iterable(
+        itertools.product(range(0, 256, 5), range(0, 256, 7), range(256))
+    ))
+    y, co, cg = fixed_point.rgb_to_ycocg_r(rgb)
+    assert (len(y), len(co), len(cg)) == (len(rgb) // 3,) * 3
+    # chroma takes 9 bits
+    assert (min(co), max(co)) == (-255, 255)
+    assert -255 <= min(cg) < -128 and 128 < max(cg) <= 255
+    assert fixed_point.ycocg_r_to_rgb(y, co, cg) == rgb
+
+
+def test_ycocg_r_luma():
+    # red, blue, green and white
+    rgb = bytes([255, 0, 0, 0, 0, 255, 0, 255, 0, 255, 255, 255])
+    y, co, cg = fixed_point.rgb_to_ycocg_r(rgb)
+    assert y == bytes([63, 63, 127, 255])
+    assert list(co) == [255, -255, 0, 0]
+    assert list(cg) == [-127, -127, 255, 0]
+
+
+@pytest.mark.parametrize(
+    'color_format',
+    [ColorFormat.YCbCr601, ColorFormat.YCbCr709, ColorFormat.YCoCg],
+)
+def test_close_to_float_converter(color_format):
+    pnm_file = PnmFile().create('P6', 50, 100, 255, 3, RGB[:15000])
+    converted = fixed_point.convert_pnm(pnm_file, ColorFormat.RGB, color_format).content
+    floats = ColorConverter.convert_image([v / 255 for v in RGB[:15000]], ColorFormat.RGB,
+                                          color_format)
+    assert max_difference(converted, [round_byte(v * 255) for v in floats]) <= 1
+
+
+@pytest.mark.parametrize(
+    'convert_from, convert_to',
+    [
+        (ColorFormat.RGB, ColorFormat.YCbCr601),
+        (ColorFormat.YCbCr709, ColorFormat.RGB),
+        (ColorFormat.YCoCg, ColorFormat.YCbCr601),
+        (ColorFormat.YCoCg, ColorFormat.YCoCg),
+    ],
+)
+def test_convert_pnm(convert_from, convert_to):
+    pnm_file = PnmFile().create('P6', 50, 100, 255, 3, RGB[:15000])
+    expected = RGB[:15000]
+    if convert_from != ColorFormat.RGB and convert_from != convert_to:
+        expected = fixed_point._TO_RGB[convert_from](expected)
+
+    if convert_to != ColorFormat.RGB and convert_from != convert_to:
+        expected = fixed_point._FROM_RGB[convert_to](expected)
+
+    assert fixed_point.convert_pnm(pnm_file, convert_from, convert_to).content == expected
+
+
+def test_convert_pnm_unsupported():
+    with pytest.raises(ValueError):
+        fixed_point.convert_pnm(
+            PnmFile().create('P6', 1, 1, 65535, 3, bytes(6)), ColorFormat.RGB, ColorFormat.YCoCg
+        )
+
+    with pytest.raises(ValueError):
+        fixed_point.convert_pnm(
+            PnmFile().create('P6', 1, 1, 255, 3, bytes(3)), ColorFormat.RGB, ColorFormat.HSL
+        )
+
+
+def planes_of(width, height, seed=1):
+    ycbcr = random.Random(seed).randbytes(width * height * 3)
+    return ycbcr, fixed_point._split(ycbcr)
+
+
+def box_by_pixel(plane, width, height, horizontal, vertical):
+    """ Rounded averages of neighbour pairs, rows are halved before the columns. """
+
+    rows = [list(plane[y * width:(y + 1) * width]) for y in range(height)]
+    if horizontal == 2:
+        rows = [
+            [(row[x] + row[min(x + 1, width - 1)] + 1) >> 1 for x in range(0, width, 2)]
+            for row in rows
+        ]
+
+    if vertical == 2:
+        rows = [
+            [(a + b + 1) >> 1 for a, b in zip(rows[y], rows[min(y + 1, height - 1)])]
+            for y in range(0, height, 2)
+        ]
+
+    return bytes(itertools.chain.from_iterable(rows))
+
+
+@pytest.mark.parametrize('subsampling', list(fixed_point.ChromaSubsampling))
+@pytest.mark.parametrize('width, height', [(8, 6), (7, 5), (1, 1), (2, 3)])
+def test_to_planar_box(subsampling, width, height):
+    ycbcr, (y, cb, cr) = planes_of(width, height)
+    planes = fixed_point.to_planar(ycbcr, width, height, subsampling=subsampling)
+    assert planes.y == y
+    assert planes.cb == box_by_pixel(cb, width, height, *subsampling.value)
+    assert planes.cr == box_by_pixel(cr, width, height, *subsampling.value)
+    assert len(planes.cb) == planes.chroma_width * planes.chroma_height
+
+    restored = fixed_point.YCbCrPlanes.from_bytes(
+        planes.to_bytes(), width, height, subsampling=subsampling
+    )
+    assert restored == planes
+    assert len(fixed_point.from_planar(restored)) == len(ycbcr)
+
+
+def test_planar_sizes():
+    ycbcr, _ = planes_of(16, 16)
+    sizes = {
+        subsampling: len(fixed_point.to_planar(ycbcr, 16, 16, subsampling=subsampling).to_bytes())
+        for subsampling in fixed_point.ChromaSubsampling
+    }
+    assert sizes == {
+        fixed_point.ChromaSubsampling.S444: 768,
+        fixed_point.ChromaSubsampling.S422: 512,
+        fixed_point.ChromaSubsampling.S420: 384,
+    }
+
+    with pytest.raises(ValueError):
+        fixed_point.YCbCrPlanes.from_bytes(bytes(100), 16, 16)
+
+    with pytest.raises(ValueError):
+        fixed_point.to_planar(ycbcr, 16, 15)
+
+
+@pytest.mark.parametrize('chroma_filter', list(fixed_point.ChromaFilter))
+@pytest.mark.parametrize('subsampling', list(fixed_point.ChromaSubsampling))
+def test_planar_keeps_flat_and_444(chroma_filter, subsampling):
+    width, height = 9, 7
+    flat = bytes([90, 30, 200]) * (width * height)
+    planes = fixed_point.to_planar(flat, width, height, subsampling=subsampling,
+                                   chroma_filter=chroma_filter)
+    assert set(planes.cb) == {30} and set(planes.cr) == {200}
+    assert fixed_point.from_planar(planes, chroma_filter) == flat
+
+    ycbcr, _ = planes_of(width, height)
+    planes = fixed_point.to_planar(ycbcr, width, height, chroma_filter=chroma_filter)
+    assert fixed_point.from_planar(planes, chroma_filter) == ycbcr
+
+
+def test_bilinear_filter():
+    # one row of chroma, 1 3 3 1 weights down and 3 1 weights up
+    ycbcr = bytes(itertools.chain.from_iterable((0, v, 0) for v in (0, 80, 160, 240)))
+    planes = fixed_point.to_planar(ycbcr, 4, 1, subsampling=fixed_point.ChromaSubsampling.S422,
+                                   chroma_filter=fixed_point.ChromaFilter.BILINEAR)
+    assert planes.cb == bytes([50, 190])
+    assert planes.chroma_filter is fixed_point.ChromaFilter.BILINEAR
+    assert fixed_point.from_planar(planes)[1::3] == bytes([50, 85, 155, 190])
+    # the filter of the planes can be overridden
+    assert fixed_point.from_planar(planes, fixed_point.ChromaFilter.BOX)[1::3] == bytes(
+        [50, 50, 190, 190]
+    )
+
+    restored = fixed_point.YCbCrPlanes.from_bytes(
+        planes.to_bytes(),
+        4,
+        1,
+        subsampling=fixed_point.ChromaSubsampling.S422,
+        chroma_filter=fixed_point.ChromaFilter.BILINEAR,
+    )
+    assert restored == planes
+
+
+@pytest.mark.parametrize('color_format', list(COEFFICIENTS))
+def test_pnm_planar_round_trip(color_format):
+    width, height = 40, 30
+    # smooth image, so that subsampled chroma stays close
+    rgb = bytes(itertools.chain.from_iterable(
+        (x * 6, y * 8, 120) for y in range(height) for x in range(width)
+    ))
+    pnm_file = PnmFile().create('P6', width, height, 255, 3, rgb)
+    planes = fixed_point.pnm_to_planar(
+        pnm_file,
+        color_format=color_format,
+        subsampling=fixed_point.ChromaSubsampling.S420,
+        chroma_filter=fixed_point.ChromaFilter.BILINEAR,
+    )
+    assert planes.y == fixed_point.rgb_to_ycbcr(rgb, color_format)[0::3]
+
+    restored = fixed_point.planar_to_pnm(planes)
+    assert (restored.width, restored.height, restored.max_color) == (width, height, 255)
+    assert max_difference(restored.content, rgb) <= 8
+
+    with pytest.raises(ValueError):
+        fixed_point.pnm_to_planar(pnm_file, color_format=ColorFormat.YCoCg)
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from src.utils import lut
+from src.utils.converter import ColorConverter, ColorFormat
+from src.utils.gamma import GammaOption, resolve_gamma
+from src.utils.lut import LUT_CACHE_SIZE, ColorLut, LutChain, get_color_lut
+
+RGB = random.Random(0).randbytes(3 * 2000) + bytes([0, 0, 0, 255, 255, 255, 255, 0, 0])
+
+
+def convert_by_pixel(rgb, chain):
+    converter = ColorConverter(chain.convert_to)
+    converted = bytearray()
+    for i in range(0, len(rgb), 3):
+        px = [0.0 if off else v / 255 for v, off in zip(rgb[i:i + 3], chain.disabled_channels)]
+        px = converter.convert_px(chain.convert_from, px)
+        px = resolve_gamma(px, chain.prev_gamma, chain.next_gamma, chain.gamma_option)
+        converted += bytes(max(0, min(255, int(v * 255))) for v in px)
+
+    return bytes(converted)
+
+
+@pytest.mark.parametrize(
+    'chain',
+    [
+        LutChain(ColorFormat.RGB, ColorFormat.HSL),
+        LutChain(ColorFormat.HSV, ColorFormat.YCbCr601),
+        LutChain(ColorFormat.RGB, ColorFormat.HSV, 2.2, 1, GammaOption.ASSIGN),
+        LutChain(
+            ColorFormat.RGB, ColorFormat.CMY, 1, 2.2, GammaOption.CONVERT, (True, False, False)
+        ),
+    ],
+)
+def test_exact_lut(chain):
+    table = ColorLut(chain)
+    assert table.apply(RGB) == convert_by_pixel(RGB, chain)
+    assert table.apply(RGB[:30]) == convert_by_pixel(RGB[:30], chain)
+
+
+@pytest.mark.parametrize('lattice_size', [17, 33])
+@pytest.mark.parametrize('convert_to', [ColorFormat.CMY, ColorFormat.YCbCr709])
+def test_lattice_lut(lattice_size, convert_to):
+    chain = LutChain(ColorFormat.RGB, convert_to)
+    converted = ColorLut(chain, lattice_size).apply(RGB)
+    expected = convert_by_pixel(RGB, chain)
+
+    # affine chains are exact on the lattice, only truncation may differ
+    assert max(abs(a - b) for a, b in zip(converted, expected)) <= 1
+
+
+def test_invalid_lattice_size():
+    with pytest.raises(ValueError):
+        ColorLut(LutChain(ColorFormat.RGB, ColorFormat.HSL), 16)
+
+
+def test_lut_cache():
+    chain = LutChain(ColorFormat.RGB, ColorFormat.HSV)
+    assert get_color_lut(chain) is get_color_lut(chain)
+    assert get_color_lut(chain, 17) is not get_color_lut(chain)
+
+    for gamma in range(LUT_CACHE_SIZE):
+        get_color_lut(LutChain(ColorFormat.RGB, ColorFormat.HSV, next_gamma=gamma + 1))
+
+    assert get_color_lut.cache_info().currsize <= LUT_CACHE_SIZE
+
+
+def test_lut_max_colors(monkeypatch):
+    monkeypatch.setattr(lut, 'LUT_MAX_COLORS', 100)
+    chain = LutChain(ColorFormat.RGB, ColorFormat.YCoCg)
+    table = ColorLut(chain)
+
+    assert table.apply(RGB[:300]) == convert_by_pixel(RGB[:300], chain)
+    assert table.apply(RGB[300:600]) == convert_by_pixel(RGB[300:600], chain)
+    assert len(table) == 100
+
+    # more colors in one image than the table keeps, the warm table is left as it is
+    assert table.apply(RGB[:1500]) == convert_by_pixel(RGB[:1500], chain)
+    assert len(table) == 100
+    assert table.apply(RGB[300:330]) == convert_by_pixel(RGB[300:330], chain)
+    assert len(table) == 100
+
+    # colors that do not fit next to the table start it over
+    assert table.apply(RGB[:30]) == convert_by_pixel(RGB[:30], chain)
+    assert len(table) == 10
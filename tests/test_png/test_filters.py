@@ -0,0 +1,101 @@
+import random
+import zlib
+
+import pytest
+
+from src.errors.png import PngError
+from src.utils.png import iter_scanlines, unfilter, filter_scanlines, FILTER_ADAPTIVE
+
+
+def reference_unfilter(data, row_size, height, bpp):
+    pixels = []
+    for y in range(height):
+        filter_type = data[y * (row_size + 1)]
+        scanline = data[y * (row_size + 1) + 1:(y + 1) * (row_size + 1)]
+        for x in range(row_size):
+            a = pixels[y * row_size + x - bpp] if x >= bpp else 0
+            b = pixels[(y - 1) * row_size + x] if y > 0 else 0
+            c = pixels[(y - 1) * row_size + x - bpp] if y > 0 and x >= bpp else 0
+            p = a + b - c
+            paeth = a if abs(p - a) <= abs(p - b) and abs(p - a) <= abs(p - c) else (
+                b if abs(p - b) <= abs(p - c) else c
+            )
+            predictor = [0, a, b, (a + b) // 2, paeth][filter_type]
+            pixels.append((scanline[x] + predictor) % 256)
+
+    return bytes(pixels)
+
+
+@pytest.mark.parametrize('bpp', [1, 3, 4])
+@pytest.mark.parametrize('filter_type', [0, 1, 2, 3, 4])
+def test_unfilter(bpp, filter_type):
+    rnd = random.Random(filter_type * 10 + bpp)
+    row_size, height = bpp * 7, 4
+    data = bytearray()
+    for y in range(height):
+        data.append(filter_type if y % 2 == 0 else rnd.randrange(5))
+        data.extend(rnd.randrange(256) for _ in range(row_size))
+
+    assert unfilter(data, row_size, height, bpp) == reference_unfilter(data, row_size, height, bpp)
+
+
+def test_unfilter_invalid_filter_type():
+    with pytest.raises(PngError):
+        unfilter(b'\x05\x00', 1, 1, 1)
+
+
+def test_iter_scanlines_by_small_chunks():
+    rnd = random.Random(0)
+    row_size, height, bpp = 12, 50, 3
+    data = bytearray()
+    for y in range(height):
+        data.append(rnd.randrange(5))
+        data.extend(rnd.randrange(256) for _ in range(row_size))
+
+    compressed = zlib.compress(data)
+    chunks = [compressed[i:i + 7] for i in range(0, len(compressed), 7)]
+    rows = list(iter_scanlines(chunks, row_size, height, bpp))
+
+    assert b''.join(rows) == reference_unfilter(data, row_size, height, bpp)
+
+
+def test_iter_scanlines_not_enough_data():
+    with pytest.raises(PngError):
+        list(iter_scanlines([zlib.compress(b'\x00\x01')], 1, 2, 1))
+
+
+@pytest.mark.parametrize('bpp', [1, 3])
+@pytest.mark.parametrize('filter_type', [FILTER_ADAPTIVE, 0, 1, 2, 3, 4])
+def test_filter_scanlines_round_trip(bpp, filter_type):
+    rnd = random.Random(bpp)
+    row_size, height = bpp * 9, 6
+    scanlines = [
+        bytes(rnd.randrange(256) if y % 2 else (x * 7 + y) % 256 for x in range(row_size))
+        for y in range(height)
+    ]
+
+    filtered = filter_scanlines(scanlines, bpp, filter_type)
+    assert len(filtered) == (row_size + 1) * height
+    assert unfilter(filtered, row_size, height, bpp) == b''.join(scanlines)
+    if filter_type != FILTER_ADAPTIVE:
+        assert set(filtered[::row_size + 1]) == {filter_type}
+
+
+def test_adaptive_filter_compresses_gradient_better():
+    row_size, height = 64, 64
+    scanlines = [bytes((x + y) % 256 for x in range(row_size)) for y in range(height)]
+
+    adaptive = zlib.compress(filter_scanlines(scanlines, 1, FILTER_ADAPTIVE))
+    plain = zlib.compress(filter_scanlines(scanlines, 1, 0))
+    assert len(adaptive) < len(plain)
+
+
+@pytest.mark.parametrize('bpp', [1, 3])
+def test_paeth_filter_extremes(bpp):
+    # differences of the neighbours reach both ends of -255..255
+    rnd = random.Random(bpp)
+    row_size, height = bpp * 16, 8
+    scanlines = [bytes(rnd.choice((0, 1, 254, 255)) for _ in range(row_size)) for _ in range(height)]
+
+    filtered = filter_scanlines(scanlines, bpp, 4)
+    assert reference_unfilter(filtered, row_size, height, bpp) == b''.join(scanlines)
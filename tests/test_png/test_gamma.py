@@ -0,0 +1,37 @@
+from array import array
+
+import pytest
+
+from src.utils.gamma import GammaOption, apply_gamma_lut, gamma_lut, resolve_gamma
+
+
+@pytest.mark.parametrize(
+    'prev_gamma, next_gamma, option',
+    [
+        (2.2, 0, GammaOption.ASSIGN),
+        (2.2, 1, GammaOption.ASSIGN),
+        (1, 2.2, GammaOption.ASSIGN),
+        (2.2, 2.2, GammaOption.ASSIGN),
+        (2.2, 1, GammaOption.CONVERT),
+        (1, 2.2, GammaOption.CONVERT),
+    ],
+)
+def test_gamma_lut(prev_gamma, next_gamma, option):
+    table = gamma_lut(prev_gamma, next_gamma, option)
+    expected = bytes(
+        int(resolve_gamma([i / 255], prev_gamma, next_gamma, option)[0] * 255)
+        for i in range(256)
+    )
+
+    assert table == expected
+    assert gamma_lut(prev_gamma, next_gamma, option) is table
+    assert apply_gamma_lut(bytearray(range(256)), table) == expected
+
+
+def test_gamma_lut_16_bit():
+    table = gamma_lut(2.2, 1, GammaOption.ASSIGN, 65536)
+    samples = array('H', [0, 1000, 30000, 65535])
+
+    assert len(table) == 65536
+    assert apply_gamma_lut(samples, table) == array('H', [table[x] for x in samples])
+    assert table[0] == 0 and table[65535] == 65535
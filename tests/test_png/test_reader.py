@@ -0,0 +1,288 @@
+import random
+import struct
+import zlib
+
+import pytest
+
+from src import config
+from src.errors.png import PngChunkTypeError, PngError
+from src.files.png import PngIO
+from src.utils.gamma import GammaOption, gamma_lut, resolve_gamma
+from src.utils.png import ADAM7_PASSES, FILTER_NONE
+
+
+def test_probe(file):
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=3, height=2, color_type=2, data=bytes(range(18)))
+
+    with PngIO(file.name) as r:
+        info = r.probe()
+
+    assert info.image_format == 'PNG'
+    assert info.width == 3
+    assert info.height == 2
+    assert info.bit_depth == 8
+    assert info.channels == 3
+    assert info.gamma is not None
+
+
+def test_iter_rows(file):
+    data = bytes(range(18))
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=3, height=2, color_type=2, data=data)
+
+    with PngIO(file.name) as r:
+        rows = list(r.iter_rows())
+
+    assert rows == [data[:9], data[9:]]
+
+    with PngIO(file.name) as r:
+        assert r.read_for_ui().decode() == data
+
+    # rows outlive the file they are read from
+    with PngIO(file.name) as r:
+        rows = r.iter_rows()
+        assert next(rows) == data[:9]
+
+    assert list(rows) == [data[9:]]
+
+
+@pytest.mark.parametrize('color_type, bpx', [(0, 1), (2, 3)])
+def test_to_rgb888(color_type, bpx, file):
+    data = bytes((i * 7) % 256 for i in range(4 * 3 * bpx))
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=4, height=3, color_type=color_type, data=data)
+
+    with PngIO(file.name) as r:
+        png = r.read_for_ui()
+
+    next_gamma = png.gamma_chunk.get_gamma() if png.gamma_chunk else 0
+    expected = bytearray()
+    for i in range(0, len(data), bpx):
+        px = [data[i]] * 3 if bpx == 1 else data[i:i + 3]
+        px = resolve_gamma([x / 255.0 for x in px], 2.2, next_gamma, GammaOption.ASSIGN)
+        expected += bytes(int(x * 255) for x in px)
+
+    assert png.to_rgb888() == expected
+
+    image = png.to_qimage()
+    assert (image.width(), image.height()) == (4, 3)
+    assert image.pixelColor(1, 2).getRgb()[:3] == tuple(expected[27:30])
+
+
+def pack_samples(rows, bit_depth):
+    data = bytearray()
+    for row in rows:
+        if bit_depth == 16:
+            data += b''.join(x.to_bytes(2, 'big') for x in row)
+            continue
+
+        bits = ''.join(format(x, f'0{bit_depth}b') for x in row)
+        bits += '0' * (-len(bits) % 8)
+        data += bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits), 8))
+
+    return bytes(data)
+
+
+@pytest.mark.parametrize(
+    'color_type, bit_depth',
+    [(t, d) for t, depths in config.PNG_BIT_DEPTHS.items() for d in depths],
+)
+@pytest.mark.parametrize('with_transparency', [False, True])
+def test_color_types_and_bit_depths(color_type, bit_depth, with_transparency, file):
+    width, height, channels = 5, 3, config.PNG_CHANNELS[color_type]
+    top = (1 << bit_depth) - 1
+    rng = random.Random(color_type * 100 + bit_depth)
+    rows = [[rng.randint(0, top) for _ in range(width * channels)] for _ in range(height)]
+
+    palette = bytes(rng.randrange(256) for _ in range(3 * (top + 1))) if color_type == 3 else None
+    transparency = None
+    if with_transparency and color_type == 3:
+        transparency = bytes(rng.randrange(256) for _ in range(top))
+    elif with_transparency and color_type in (0, 2):
+        transparency = b''.join(x.to_bytes(2, 'big') for x in rows[1][:channels])
+
+    with PngIO(file.name, 'wb') as w:
+        w.write(
+            width=width,
+            height=height,
+            color_type=color_type,
+            bit_depth=bit_depth,
+            data=pack_samples(rows, bit_depth),
+            palette=palette,
+            transparency=transparency,
+        )
+
+    with PngIO(file.name) as r:
+        png = r.read_for_ui()
+
+    next_gamma = png.gamma_chunk.get_gamma() if png.gamma_chunk else 0
+    table = gamma_lut(2.2, next_gamma, GammaOption.ASSIGN)
+    expected = bytearray()
+    for row in rows:
+        for x in range(width):
+            px = row[x * channels:(x + 1) * channels]
+            if color_type == 3:
+                rgb = list(palette[px[0] * 3:px[0] * 3 + 3])
+                alpha = 255
+                if transparency is not None and px[0] < len(transparency):
+                    alpha = transparency[px[0]]
+            else:
+                scaled = [v * 255 // top if bit_depth < 8 else v >> (bit_depth - 8) for v in px]
+                rgb = scaled[:3] if color_type in (2, 6) else scaled[:1] * 3
+                alpha = scaled[-1] if color_type in (4, 6) else 255
+                if transparency is not None and px == rows[1][:channels]:
+                    alpha = 0
+
+            expected += bytes(table[v] for v in rgb) + bytes([alpha])
+
+    assert png.has_alpha() == (color_type in (4, 6) or with_transparency)
+    assert png.to_rgba8888() == expected
+    assert png.to_rgb888() == bytes(v for i, v in enumerate(expected) if i % 4 != 3)
+    assert png.to_qimage().pixelColor(4, 2).getRgb()[:3] == tuple(expected[-4:-1])
+
+
+@pytest.mark.parametrize(
+    'color_type, bit_depth',
+    [(t, d) for t, depths in config.PNG_BIT_DEPTHS.items() for d in depths],
+)
+@pytest.mark.parametrize('width, height', [(1, 1), (3, 2), (11, 9), (17, 16)])
+def test_interlaced(color_type, bit_depth, width, height, file):
+    channels = config.PNG_CHANNELS[color_type]
+    rng = random.Random(width * height + bit_depth)
+    rows = [
+        [rng.randint(0, (1 << bit_depth) - 1) for _ in range(width * channels)]
+        for _ in range(height)
+    ]
+    palette = bytes(i % 256 for i in range(3 << bit_depth)) if color_type == 3 else None
+
+    pngs = []
+    for interlace_method in (0, 1):
+        with PngIO(file.name, 'wb') as w:
+            w.write(
+                width=width,
+                height=height,
+                color_type=color_type,
+                bit_depth=bit_depth,
+                data=pack_samples(rows, bit_depth),
+                palette=palette,
+                interlace_method=interlace_method,
+            )
+
+        with PngIO(file.name) as r:
+            pngs.append(r.read_for_ui())
+
+    plain, interlaced = pngs
+    assert interlaced.ihdr_chunk.interlace_method == 1
+    assert interlaced.decode() == plain.decode() == pack_samples(rows, bit_depth)
+    assert interlaced.to_rgba8888() == plain.to_rgba8888()
+
+
+def test_interlaced_pass_order(file):
+    width, height = 11, 9
+    data = random.Random(7).randbytes(width * height * 3)
+    with PngIO(file.name, 'wb') as w:
+        w.write(
+            width=width,
+            height=height,
+            color_type=2,
+            data=data,
+            interlace_method=1,
+            filter_type=FILTER_NONE,
+        )
+
+    with PngIO(file.name) as r:
+        png = r.read_for_ui()
+
+    expected = bytearray()
+    for x0, y0, dx, dy in ADAM7_PASSES:
+        for y in range(y0, height, dy):
+            expected += b'\x00' + b''.join(
+                data[(y * width + x) * 3:(y * width + x) * 3 + 3]
+                for x in range(x0, width, dx)
+            )
+
+    idat = b''.join(bytes(chunk.data) for chunk in png.idat_chunks)
+    assert zlib.decompress(idat) == expected
+
+
+def test_interlaced_progressive(file):
+    width, height = 20, 12
+    data = random.Random(3).randbytes(width * height)
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=width, height=height, color_type=0, data=data, interlace_method=1)
+
+    with PngIO(file.name) as r:
+        png = r.read_for_ui()
+
+    previews = []
+    samples = png.decode_samples(lambda preview: previews.append(bytes(preview)))
+
+    assert len(previews) == 7
+    assert previews[-1] == samples == data
+    # after the first pass every pixel repeats the top left one of its 8x8 block
+    assert previews[0] == bytes(
+        data[(y // 8 * 8) * width + x // 8 * 8] for y in range(height) for x in range(width)
+    )
+
+
+def insert_chunk(file_name, ctype, body):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+
+    # right after IHDR: signature, length, type, 13 bytes of body and CRC
+    at = 8 + 8 + 13 + 4
+    chunk = struct.pack('>I4s', len(body), ctype) + body
+    chunk += struct.pack('>I', zlib.crc32(ctype + body))
+    with open(file_name, 'wb') as f:
+        f.write(data[:at] + chunk + data[at:])
+
+
+def test_index_chunks(file):
+    data = random.Random(1).randbytes(64 * 48)
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=64, height=48, color_type=0, data=data, idat_chunk_size=100)
+
+    with open(file.name, 'rb') as f:
+        raw = f.read()
+
+    with PngIO(file.name) as r:
+        index = r.index_chunks()
+
+    assert index[0].ctype == 'IHDR' and index[-1].ctype == 'IEND'
+    assert sum(location.ctype == 'IDAT' for location in index) > 1
+    for location in index:
+        length, ctype = struct.unpack('>I4s', raw[location.offset - 8:location.offset])
+        assert (ctype.decode(), length) == (location.ctype, location.length)
+
+    assert index[-1].offset + 4 == len(raw)
+
+
+def test_unknown_chunks(file):
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=2, height=2, color_type=0, data=bytes(4))
+
+    insert_chunk(file.name, b'vpAg', b'\x00' * 9)
+    with PngIO(file.name) as r:
+        assert r.read_for_ui().decode() == bytes(4)
+
+    insert_chunk(file.name, b'ABCD', b'')
+    with PngIO(file.name) as r:
+        with pytest.raises(PngChunkTypeError):
+            r.read_for_ui()
+
+
+@pytest.mark.parametrize('cut', [0, 5, 20, -5])
+def test_broken_file(cut, file):
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=2, height=2, color_type=0, data=bytes(4))
+
+    with open(file.name, 'rb') as f:
+        raw = f.read()
+
+    with open(file.name, 'wb') as f:
+        f.write(raw[:cut])
+
+    with PngIO(file.name) as r:
+        with pytest.raises(PngError):
+            r.probe()
@@ -0,0 +1,99 @@
+import struct
+import zlib
+
+import pytest
+
+from src.errors.png import PngError
+from src.files.png import PngIO
+from src.utils.png import CompressionProfile, adler32_combine, parallel_deflate
+
+
+def read_chunks(file_name):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+
+    chunks, offset = [], 8
+    while offset < len(data):
+        length, ctype = struct.unpack('>I4s', data[offset:offset + 8])
+        chunks.append((ctype, data[offset + 8:offset + 8 + length]))
+        offset += length + 12
+
+    return chunks
+
+
+@pytest.mark.parametrize('profile', list(CompressionProfile))
+def test_write_profiles(profile, file):
+    data = bytes((x * y) % 256 for y in range(20) for x in range(30))
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=10, height=20, color_type=2, data=data, profile=profile)
+
+    with PngIO(file.name) as r:
+        assert r.read_for_ui().decode() == data
+
+
+@pytest.mark.parametrize('idat_chunk_size', [1, 7, 100, 1 << 20])
+def test_write_idat_chunk_size(idat_chunk_size, file):
+    data = bytes(range(256)) * 4
+    with PngIO(file.name, 'wb') as w:
+        w.write(
+            width=32,
+            height=32,
+            color_type=0,
+            data=data,
+            idat_chunk_size=idat_chunk_size,
+            compression_level=9,
+            compression_strategy=zlib.Z_HUFFMAN_ONLY,
+        )
+
+    idat_chunks = [data for ctype, data in read_chunks(file.name) if ctype == b'IDAT']
+    assert all(len(chunk) <= idat_chunk_size for chunk in idat_chunks)
+    assert all(len(chunk) == idat_chunk_size for chunk in idat_chunks[:-1])
+
+    with PngIO(file.name) as r:
+        assert r.read_for_ui().decode() == data
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    [
+        {'compression_level': 10},
+        {'compression_strategy': 100},
+        {'idat_chunk_size': 0},
+        {'filter_type': 5},
+        {'workers': 0},
+        {'bit_depth': 3},
+        {'bit_depth': 16, 'color_type': 3, 'palette': b'\x00\x00\x00'},
+        {'color_type': 3},
+        {'color_type': 5},
+    ],
+)
+def test_write_invalid_options(kwargs, file):
+    with PngIO(file.name, 'wb') as w:
+        with pytest.raises(PngError):
+            w.write(**{'width': 1, 'height': 1, 'color_type': 0, 'data': b'\x00', **kwargs})
+
+
+@pytest.mark.parametrize('level', [-1, 0, 1, 9])
+@pytest.mark.parametrize('strategy', [zlib.Z_DEFAULT_STRATEGY, zlib.Z_RLE])
+@pytest.mark.parametrize('size', [0, 1000, 5000, 12345])
+def test_parallel_deflate(level, strategy, size):
+    data = bytes((i * i) % 251 for i in range(size))
+    chunks = [data[i:i + 333] for i in range(0, size, 333)]
+
+    compressed = b''.join(parallel_deflate(chunks, level, strategy, 3, block_size=1000))
+    assert zlib.decompress(compressed) == data
+
+
+def test_adler32_combine():
+    first, second = b'parallel', b' deflate' * 10000
+    combined = adler32_combine(zlib.adler32(first), zlib.adler32(second), len(second))
+    assert combined == zlib.adler32(first + second)
+
+
+def test_write_workers(file):
+    data = bytes((x ^ y) % 256 for y in range(300) for x in range(600))
+    with PngIO(file.name, 'wb') as w:
+        w.write(width=200, height=300, color_type=2, data=data, workers=4)
+
+    with PngIO(file.name) as r:
+        assert r.read_for_ui().decode() == data
@@ -0,0 +1,57 @@
+import pytest
+
+from src.entities.pnm import PnmFileUI
+from src.utils.scaling.displacement import displace
+
+
+@pytest.fixture
+def rgb_image() -> PnmFileUI:
+    return PnmFileUI(
+        pnm_format='P6',
+        width=2,
+        height=2,
+        max_color=255,
+        bytes_per_px=3,
+        content=[i / 12 for i in range(12)],
+    )
+
+
+def test_content_is_float_array(rgb_image):
+    assert rgb_image.content.typecode == 'f'
+    assert not hasattr(rgb_image, '__dict__')
+
+
+def test_get_px_returns_view(rgb_image):
+    px = rgb_image.get_px(3)
+    assert isinstance(px, memoryview)
+    assert px.tolist() == pytest.approx([3 / 12, 4 / 12, 5 / 12])
+
+    rgb_image.set_px(3, [1, 1, 1])
+    assert px.tolist() == [1, 1, 1]
+
+
+def test_get_px_disabled_channels_copy(rgb_image):
+    px = rgb_image.get_px(3, [False, True, False])
+    assert px == pytest.approx([3 / 12, 0, 5 / 12])
+    assert rgb_image.content[4] == pytest.approx(4 / 12)
+
+
+def test_get_row(rgb_image):
+    assert rgb_image.get_row(1).tolist() == pytest.approx([i / 12 for i in range(6, 12)])
+
+
+def test_to_rgb888():
+    img = PnmFileUI(
+        pnm_format='P5',
+        width=3,
+        height=1,
+        max_color=255,
+        bytes_per_px=1,
+        content=[-1.0, 0.5, 2.0],
+    )
+    assert img.to_rgb888() == bytearray([0, 0, 0, 127, 127, 127, 255, 255, 255])
+
+
+def test_displace(rgb_image):
+    displace(rgb_image, 1, 1)
+    assert rgb_image.content.tolist() == pytest.approx([0] * 9 + [0, 1 / 12, 2 / 12])
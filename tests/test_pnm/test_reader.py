@@ -70,3 +70,238 @@ def test_valid_file_read_ui(
     assert pnm_file.max_color == expected_pnm_file.max_color
     assert pnm_file.bytes_per_px == expected_pnm_file.bytes_per_px
     assert tuple(pnm_file.content) == tuple(expected_pnm_file.content)
+
+
+def test_wrong_content_size_mapped(
+    pnm_file_content_size_not_enough,
+    pnm_file_content_size_too_much,
+):
+    with PnmIO(pnm_file_content_size_not_enough) as r:
+        with pytest.raises(PnmSizeError):
+            r.read_mapped()
+
+    with PnmIO(pnm_file_content_size_too_much) as r:
+        with pytest.raises(PnmSizeError):
+            r.read_mapped()
+
+
+def test_valid_file_read_mapped(
+    valid_pnm_file_total,
+):
+    file_path, expected_pnm_file = valid_pnm_file_total
+    with PnmIO(file_path) as r:
+        pnm_file = r.read_mapped()
+
+    assert pnm_file.pnm_format == expected_pnm_file.pnm_format
+    assert pnm_file.width == expected_pnm_file.width
+    assert pnm_file.height == expected_pnm_file.height
+    assert pnm_file.max_color == expected_pnm_file.max_color
+    assert isinstance(pnm_file.content, memoryview)
+    assert pnm_file.content.readonly
+    assert pnm_file.content == expected_pnm_file.content
+
+
+def test_read_ui_scaled_by_max_color(
+    file,
+):
+    with PnmIO(file.name, 'wb') as w:
+        w.write(
+            pnm_format='P5',
+            width=2,
+            height=2,
+            max_color_value=4,
+            image_content=(0, 1, 2, 4),
+        )
+
+    with PnmIO(file.name) as r:
+        pnm_file = r.read_for_ui()
+
+    assert pnm_file.max_color == 4
+    assert pnm_file.content.typecode == 'f'
+    assert tuple(pnm_file.content) == (0.0, 0.25, 0.5, 1.0)
+
+
+def test_wrong_content_size_ui(
+    pnm_file_content_size_not_enough,
+    pnm_file_content_size_too_much,
+):
+    with PnmIO(pnm_file_content_size_not_enough) as r:
+        with pytest.raises(PnmSizeError):
+            r.read_for_ui()
+
+    with PnmIO(pnm_file_content_size_too_much) as r:
+        with pytest.raises(PnmSizeError):
+            r.read_for_ui()
+
+
+def test_iter_rows(
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(b'P6\n1 3\n255\n\x00\x01\x02\x03\x04\x05\x06\x07\x08')
+
+    with PnmIO(file.name) as r:
+        strips = list(r.iter_rows(strip_height=2))
+
+    assert [strip.height for strip in strips] == [2, 1]
+    assert all(strip.width == 1 and strip.bytes_per_pixel == 3 for strip in strips)
+    assert b''.join(strip.content for strip in strips) == bytes(range(9))
+
+
+def test_iter_rows_wrong_content_size(
+    pnm_file_content_size_too_much,
+):
+    with PnmIO(pnm_file_content_size_too_much) as r:
+        with pytest.raises(PnmSizeError):
+            list(r.iter_rows())
+
+
+def test_probe(
+    valid_pnm_file_total,
+):
+    file_path, expected_pnm_file = valid_pnm_file_total
+    with PnmIO(file_path) as r:
+        info = r.probe()
+
+    assert info.image_format == expected_pnm_file.pnm_format
+    assert info.width == expected_pnm_file.width
+    assert info.height == expected_pnm_file.height
+    assert info.bit_depth == 8
+    assert info.channels == expected_pnm_file.bytes_per_pixel
+
+
+@pytest.mark.parametrize(
+    'data, pnm_format, width, height, max_color, content',
+    [
+        (b'P5 2 1 255\n\x01\x02', 'P5', 2, 1, 255, b'\x01\x02'),
+        (b'P5\n# comment\n2\t1 # comment\n255\n\x01\x02', 'P5', 2, 1, 255, b'\x01\x02'),
+        (b'P6\n1\n1\n15\r\x01\x02\x03', 'P6', 1, 1, 15, b'\x01\x02\x03'),
+        (b'P1\n3 2\n1 0 1\n0 0 1\n', 'P1', 3, 2, 1, b'\x00\x01\x00\x01\x01\x00'),
+        (b'P1\n3 2\n101001', 'P1', 3, 2, 1, b'\x00\x01\x00\x01\x01\x00'),
+        (b'P2\n2 2\n# comment\n10\n0 5\n10 7\n', 'P2', 2, 2, 10, b'\x00\x05\x0a\x07'),
+        (b'P3\n1 1\n65535\n1 256 65535\n', 'P3', 1, 1, 65535, (1, 256, 65535)),
+        (b'P4\n10 2\n\x80\x40\xff\xc0', 'P4', 10, 2, 1, bytes([0] + [1] * 8 + [0] + [0] * 10)),
+    ],
+)
+def test_read_header_and_formats(
+    data,
+    pnm_format,
+    width,
+    height,
+    max_color,
+    content,
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(data)
+
+    with PnmIO(file.name) as r:
+        pnm_file = r.read()
+
+    assert pnm_file.pnm_format == pnm_format
+    assert pnm_file.width == width
+    assert pnm_file.height == height
+    assert pnm_file.max_color == max_color
+    assert tuple(pnm_file.content) == tuple(content)
+
+
+@pytest.mark.parametrize(
+    'data, error',
+    [
+        (b'P2\n2 2\n255\n0 1 2\n', PnmSizeError),
+        (b'P2\n2 1\n255\n0 300\n', PnmColorError),
+        (b'P2\n2 1\n10\n0 11\n', PnmColorError),
+        (b'P3\n1 1\n1000\n1 2 1001\n', PnmColorError),
+        (b'P2\n2 1\n255\n0 -1\n', PnmColorError),
+        (b'P1\n2 1\n12\n', PnmColorError),
+        (b'P4\n10 2\n\x80\x40\xff', PnmSizeError),
+        (b'P5\n2 1\n0\n\x00\x00', PnmColorError),
+    ],
+)
+def test_read_invalid_content(
+    data,
+    error,
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(data)
+
+    with PnmIO(file.name) as r:
+        with pytest.raises(error):
+            r.read()
+
+
+def test_read_pam_header(
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(
+            b'P7\n# comment\nWIDTH 1\nHEIGHT 1\nDEPTH 2\nMAXVAL 65535\n'
+            b'TUPLTYPE GRAYSCALE_ALPHA\nENDHDR\n\x01\x00\xff\xff'
+        )
+
+    with PnmIO(file.name) as r:
+        pnm_file = r.read_for_ui()
+
+    assert pnm_file.bytes_per_px == 2
+    assert pnm_file.tuple_type == 'GRAYSCALE_ALPHA'
+    assert pnm_file.get_px(0) == [pnm_file.content[0]] * 3
+    assert pnm_file.content[1] == 1.0
+
+
+@pytest.mark.parametrize(
+    'data',
+    [
+        b'P7\nWIDTH 1\nHEIGHT 1\nDEPTH 3\nMAXVAL 255\nTUPLTYPE GRAYSCALE\nENDHDR\n\x00\x00\x00',
+        b'P7\nWIDTH 1\nHEIGHT 1\nMAXVAL 255\nENDHDR\n\x00',
+        b'P7\nWIDTH 1\nHEIGHT 1\nDEPTH 1\nMAXVAL 255\n',
+    ],
+)
+def test_read_invalid_pam_header(
+    data,
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(data)
+
+    with PnmIO(file.name) as r:
+        with pytest.raises(PnmFormatError):
+            r.read()
+
+
+@pytest.mark.parametrize('reuse_buffer', [False, True])
+def test_iter_frames(
+    reuse_buffer,
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(
+            b'P5\n2 1\n255\n\x01\x02'
+            b'P6\n1 1\n255\n\x03\x04\x05'
+            b'P5 1 1 65535\n\x01\x00'
+            b'P4\n3 1\n\xa0\n'
+        )
+
+    with PnmIO(file.name) as r:
+        frames = [
+            (frame.pnm_format, frame.width, tuple(frame.content))
+            for frame in r.iter_frames(reuse_buffer=reuse_buffer)
+        ]
+
+    assert frames == [
+        ('P5', 2, (1, 2)),
+        ('P6', 1, (3, 4, 5)),
+        ('P5', 1, (256,)),
+        ('P4', 3, (0, 1, 0)),
+    ]
+
+
+def test_iter_frames_wrong_content_size(
+    file,
+):
+    with open(file.name, 'wb') as f:
+        f.write(b'P5\n2 1\n255\n\x01\x02P5\n2 1\n255\n\x01')
+
+    with PnmIO(file.name) as r:
+        with pytest.raises(PnmSizeError):
+            list(r.iter_frames())
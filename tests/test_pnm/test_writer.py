@@ -1,3 +1,5 @@
+from array import array
+
 import pytest
 
 from src.errors.pnm import PnmError, PnmSizeError, PnmFormatError, PnmColorError
@@ -106,7 +108,7 @@ def test_invalid_image_format(
 @pytest.mark.parametrize(
     'pnm_format, width, height, max_color_value, content',
     [
-        ('P5', 1, 1, 256, (0,)),
+        ('P5', 1, 1, 65536, (0,)),
         (
             'P6',
             1,
@@ -218,3 +220,153 @@ def test_write_file(
     assert pnm_file.bytes_per_pixel == len(content) // (width * height)
     assert pnm_file.bytes_per_pixel == pnm_file.bytes_per_pixel
     assert pnm_file.content == expected
+
+
+@pytest.mark.parametrize(
+    'content',
+    [
+        b'\x00\x10\x20\x40',
+        bytearray(b'\x00\x10\x20\x40'),
+        memoryview(b'\x00\x10\x20\x40'),
+        array('B', [0, 16, 32, 64]),
+        array('H', [0, 16, 32, 64]),
+        memoryview(array('H', [0, 16, 32, 64])),
+        (0, 16, 32, 64),
+        (-5, 16, 32, 64),
+    ],
+)
+def test_write_file_buffer(
+    content,
+    file,
+):
+    with PnmIO(file.name, 'wb') as w:
+        w.write(
+            pnm_format='P5',
+            width=2,
+            height=2,
+            max_color_value=255,
+            image_content=content,
+        )
+
+    with open(file.name, 'rb') as f:
+        assert f.read() == b'P5\n2 2\n255\n\x00\x10\x20\x40'
+
+
+def test_invalid_color_value_writes_nothing(file):
+    with PnmIO(file.name, 'wb') as w:
+        with pytest.raises(PnmColorError):
+            w.write(
+                pnm_format='P5',
+                width=2,
+                height=1,
+                max_color_value=128,
+                image_content=b'\x00\xff',
+            )
+
+    with open(file.name, 'rb') as f:
+        assert f.read() == b''
+
+
+def test_write_file_16_bit(file):
+    content = (0, 255, 256, 1000, 65535, 7)
+    with PnmIO(file.name, 'wb') as w:
+        w.write(
+            pnm_format='P6',
+            width=2,
+            height=1,
+            max_color_value=65535,
+            image_content=content,
+        )
+
+    with open(file.name, 'rb') as f:
+        assert f.read() == (
+            b'P6\n2 1\n65535\n'
+            b'\x00\x00\x00\xff\x01\x00\x03\xe8\xff\xff\x00\x07'
+        )
+
+    with PnmIO(file.name, 'rb') as r:
+        pnm_file = r.read()
+
+    assert pnm_file.max_color == 65535
+    assert pnm_file.get_sample_size() == 2
+    assert tuple(pnm_file.content) == content
+
+    with PnmIO(file.name, 'rb') as r:
+        pnm_file = r.read_for_ui()
+
+    assert pnm_file.content[4] == 1.0
+    assert pnm_file.content[2] == pytest.approx(256 / 65535)
+
+
+def test_write_rows(file):
+    with PnmIO(file.name, 'wb') as w:
+        w.write_header(pnm_format='P5', width=2, height=3)
+        w.write_rows(b'\x00\x01\x02\x03')
+        with pytest.raises(PnmSizeError):
+            w.write_rows(b'\x04\x05\x06\x07')
+
+        w.write_rows((4, 5))
+
+    with PnmIO(file.name, 'rb') as r:
+        pnm_file = r.read()
+
+    assert pnm_file.height == 3
+    assert pnm_file.content == bytes(range(6))
+
+
+def test_write_rows_not_finished(file):
+    with pytest.raises(PnmSizeError):
+        with PnmIO(file.name, 'wb') as w:
+            w.write_header(pnm_format='P5', width=2, height=3)
+            w.write_rows(b'\x00\x01')
+
+
+@pytest.mark.parametrize(
+    'tuple_type, content',
+    [
+        ('GRAYSCALE', (0, 1, 2, 3)),
+        ('GRAYSCALE_ALPHA', (0, 255, 1, 255, 2, 0, 3, 0)),
+        ('RGB', tuple(range(12))),
+        ('RGB_ALPHA', tuple(range(16))),
+    ],
+)
+def test_write_file_pam(
+    tuple_type,
+    content,
+    file,
+):
+    with PnmIO(file.name, 'wb') as w:
+        w.write(
+            pnm_format='P7',
+            width=2,
+            height=2,
+            image_content=content,
+            tuple_type=tuple_type,
+        )
+
+    with open(file.name, 'rb') as f:
+        assert f.read().startswith(
+            b'P7\nWIDTH 2\nHEIGHT 2\nDEPTH %d\nMAXVAL 255\nTUPLTYPE %s\nENDHDR\n' % (
+                len(content) // 4, tuple_type.encode()
+            )
+        )
+
+    with PnmIO(file.name, 'rb') as r:
+        pnm_file = r.read()
+
+    assert pnm_file.pnm_format == 'P7'
+    assert pnm_file.tuple_type == tuple_type
+    assert pnm_file.bytes_per_pixel == len(content) // 4
+    assert tuple(pnm_file.content) == content
+
+
+def test_write_file_pam_invalid_tuple_type(file):
+    with PnmIO(file.name, 'wb') as w:
+        with pytest.raises(PnmFormatError):
+            w.write(
+                pnm_format='P7',
+                width=1,
+                height=1,
+                image_content=(0, 0, 0),
+                tuple_type='CMYK',
+            )